@@ -25,24 +25,31 @@ SOFTWARE.
 """
 
 import asyncio
-import gc
 import sys
 import time
-from collections import deque
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from io import BufferedWriter
 from pathlib import Path
-from PySide6.QtGui import QCloseEvent, QFont
+import numpy as np
+from PySide6.QtGui import QCloseEvent, QFont, QStandardItemModel, QStandardItem
 from PySide6.QtCore import Qt, QRect, QLocale, QTimer, Signal, Slot
-from PySide6.QtWidgets import QVBoxLayout, QGridLayout
+from PySide6.QtWidgets import QVBoxLayout, QHBoxLayout, QGridLayout
 from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QFileDialog, QMessageBox
-from PySide6.QtWidgets import QGroupBox, QPushButton, QTextBrowser, QLabel, QLineEdit, QComboBox
+from PySide6.QtWidgets import QGroupBox, QPushButton, QTextBrowser, QLabel, QLineEdit, QComboBox, QCheckBox
 import pyqtgraph as pg
-from pyqtgraph import PlotWidget
+from pyqtgraph import GraphicsLayoutWidget
 from qasync import QEventLoop, asyncSlot
 from bleak import BleakScanner
 from bleak.backends.device import BLEDevice
 from qmyo import QMyo
 
-pg.setConfigOptions(leftButtonPan=False)
+pg.setConfigOptions(leftButtonPan=False, useOpenGL=True, antialias=False)
+
+# ASCII of every raw EMG value (int8), indexed by its byte value
+EMG_ITOA = [str(i - 256 if i > 127 else i).encode() for i in range(256)]
+# blocks of formatted rows waiting for the writer thread, recording stops when it falls this far behind
+CSV_QUEUE_SIZE = 1024
 
 
 class MainWindow(QMainWindow):
@@ -56,6 +63,11 @@ class MainWindow(QMainWindow):
         self.count_repetition = 1
         self.sample_displayed = 800
         self._dir             = str(Path().absolute())
+        self._csv_path        = ''
+        self._csv_fh          = None
+        self._csv_queue       = None
+        self._csv_executor    = None
+        self._csv_future      = None
 
         self._myo             = None
         self._connected       = False
@@ -91,6 +103,7 @@ class MainWindow(QMainWindow):
         self.btn_save.setEnabled(False)
         #
         self.cbx_device.setEnabled(True)
+        self.chk_priority.setEnabled(True)
         #
         self.lne_gesture.setEnabled(True)
         self.lne_repetition.setEnabled(True)
@@ -106,6 +119,10 @@ class MainWindow(QMainWindow):
         self.lne_gesture.editingFinished.connect(self.handle_editingfinished_gesture)
         self.lne_repetition.editingFinished.connect(self.handle_editingfinished_repetition)
 
+        # redraw EMG plots at ~30 Hz, independently of the EMG sample rate
+        self.timer.timeout.connect(self._flush_plots)
+        self.timer.start(33)
+
         # set ui for the main window
         self.setWindowTitle('Myo Data Collector')
         self.setFixedSize(1330, 860)
@@ -123,31 +140,48 @@ class MainWindow(QMainWindow):
         layout_emg.setObjectName('LayoutPlotEmg')
         layout_emg.setContentsMargins(0, 0, 0, 0)
 
-        self.plot_emgs  = list()
-        self.curve_emgs = list()
+        # ring buffer of displayed samples, the newest sample is written at `_emg_idx`
+        self._emg_buf   = np.zeros((8, self.sample_displayed), dtype=np.int16)
+        self._emg_idx   = 0
+        self._emg_dirty = False
+        # unrolled copy of the ring handed to the plots, reused by every redraw
+        self._emg_view  = np.zeros_like(self._emg_buf)
+
+        self.plot_emgs = list()
+        self._emg_pen  = pg.mkPen((255, 255, 0), width=1, cosmetic=True)
+
+        # all channels share one scene, their x axes are linked to the first plot
+        glw = GraphicsLayoutWidget()
+        glw.setObjectName('GraphicsLayoutEmg')
+        layout_emg.addWidget(glw)
 
         for i in range(8):
-            pwg = PlotWidget(name='PlotEmg')
-            pwg.setXRange(0, self.sample_displayed)
-            pwg.setYRange(-200, 200)
-            # pwg.setAspectLocked(True)
-            self.plot_emgs.append(pwg.plot(pen='y'))
-            self.curve_emgs.append(deque(self.sample_displayed * [0], maxlen=self.sample_displayed))
-            self.plot_emgs[-1].setData(self.curve_emgs[-1])
-            layout_emg.addWidget(pwg)
+            plt = glw.addPlot(row=i, col=0, name=f'PlotEmg{i}')
+            plt.setXRange(0, self.sample_displayed)
+            plt.setYRange(-200, 200)
+            plt.setClipToView(True)
+            # display only: the recording file still gets every sample
+            plt.setDownsampling(ds=4, auto=False, mode='peak')
+            plt.disableAutoRange()
+            if i > 0:
+                plt.setXLink(glw.getItem(0, 0))
+            if i < 7:
+                plt.hideAxis('bottom')
+            # plt.setAspectLocked(True)
+            self.plot_emgs.append(plt.plot(pen=self._emg_pen))
+            self.plot_emgs[-1].setData(self._emg_buf[i])
+
+        # bound setters, used when redrawing the plots
+        self._emg_setdatas = [plot_emg.setData for plot_emg in self.plot_emgs]
 
     def _init_ui_status(self) -> None:
         self.gbx_status = QGroupBox('Status', self)
         self.gbx_status.setObjectName('GroupBoxStatus')
         self.gbx_status.setGeometry(QRect(1040, 10, 280, 80))
 
-        wdg_status = QWidget(self.gbx_status)
-        wdg_status.setObjectName('WidgetStatus')
-        wdg_status.setGeometry(QRect(10, 20, 260, 50))
-
-        layout_status = QGridLayout()
+        layout_status = QGridLayout(self.gbx_status)
         layout_status.setObjectName('LayoutStatus')
-        layout_status.setContentsMargins(0, 0, 0, 0)
+        layout_status.setContentsMargins(10, 20, 10, 10)
 
         self.lbl_rssi_0 = QLabel(text='RSSI')
         self.lbl_rssi_0.setObjectName('LabelRssi')
@@ -166,8 +200,6 @@ class MainWindow(QMainWindow):
         layout_status.addWidget(self.lbl_battery_0, 1, 0, 1, 1)
         layout_status.addWidget(self.lbl_battery_1, 1, 1, 1, 1)
 
-        wdg_status.setLayout(layout_status)
-
     def _init_ui_directory(self) -> None:
         font = QFont()
         font.setPointSize(10)
@@ -216,36 +248,39 @@ class MainWindow(QMainWindow):
         self.gbx_discover.setObjectName('GroupBoxFile')
         self.gbx_discover.setGeometry(QRect(1040, 350, 280, 100))
 
-        wdg_discover = QWidget(self.gbx_discover)
-        wdg_discover.setObjectName('WidgetDiscover')
-        wdg_discover.setGeometry(QRect(10, 30, 260, 60))
-
-        layout_discover = QVBoxLayout()
+        layout_discover = QVBoxLayout(self.gbx_discover)
         layout_discover.setObjectName('LayoutDiscover')
-        layout_discover.setContentsMargins(0, 0, 0, 0)
+        layout_discover.setContentsMargins(10, 30, 10, 10)
 
         self.btn_discover = QPushButton('Discover')
-        self.setObjectName('ButtonDiscover')
+        self.btn_discover.setObjectName('ButtonDiscover')
+
+        # off by default: on Linux, it changes the connection interval defaults of the whole adapter while connected
+        self.chk_priority = QCheckBox('Low latency')
+        self.chk_priority.setObjectName('CheckBoxPriority')
+        self.chk_priority.setChecked(False)
+        self.chk_priority.setToolTip('Request a short BLE connection interval (7.5 - 15 ms).\n'
+                                     'On Linux (as root), this changes the adapter defaults for every LE connection\n'
+                                     'until the device is disconnected (until reboot if the program is killed).')
 
         self.cbx_device = QComboBox()
         self.cbx_device.setObjectName('ComboBoxDevice')
 
-        layout_discover.addWidget(self.btn_discover)
+        layout_discover_button = QHBoxLayout()
+        layout_discover_button.addWidget(self.btn_discover)
+        layout_discover_button.addWidget(self.chk_priority)
+
+        layout_discover.addLayout(layout_discover_button)
         layout_discover.addWidget(self.cbx_device)
-        wdg_discover.setLayout(layout_discover)
 
     def _init_ui_button(self):
         self.gbx_button = QGroupBox(parent=self)
         self.gbx_button.setObjectName('GroupBoxFunction')
         self.gbx_button.setGeometry(QRect(1040, 460, 280, 155))
 
-        wdg_button = QWidget(self.gbx_button)
-        wdg_button.setObjectName('WidgetButton')
-        wdg_button.setGeometry(QRect(10, 10, 260, 140))
-
-        layout_button = QVBoxLayout()
+        layout_button = QVBoxLayout(self.gbx_button)
         layout_button.setObjectName('LayoutButton')
-        layout_button.setContentsMargins(0, 0, 0, 0)
+        layout_button.setContentsMargins(10, 10, 10, 5)
 
         self.btn_conn = QPushButton('Connect')
         self.btn_conn.setObjectName('ButtonConnect')
@@ -263,7 +298,6 @@ class MainWindow(QMainWindow):
         layout_button.addWidget(self.btn_disconn)
         layout_button.addWidget(self.btn_start)
         layout_button.addWidget(self.btn_save)
-        wdg_button.setLayout(layout_button)
 
     def _init_ui_console(self):
         font = QFont()
@@ -278,6 +312,23 @@ class MainWindow(QMainWindow):
         self.tbr_console.setGeometry(QRect(5, 10, 270, 215))
         self.tbr_console.setLocale(QLocale(QLocale.English, QLocale.Taiwan))
         self.tbr_console.setFont(font)
+        # keep only the latest messages, older blocks are dropped from the document
+        self.tbr_console.document().setMaximumBlockCount(200)
+
+        # messages are buffered and appended to the console every 250 ms
+        self._console_buf  = list()
+        self.timer_console = QTimer(self)
+        self.timer_console.timeout.connect(self._flush_console)
+        self.timer_console.start(250)
+
+    def _append_console(self, message: str) -> None:
+        self._console_buf.append(message)
+
+    def _flush_console(self) -> None:
+        if len(self._console_buf) == 0:
+            return
+        self.tbr_console.append('\n'.join(self._console_buf))
+        self._console_buf.clear()
 
     @Slot(bool)
     def receive_connected(self, connected: bool) -> None:
@@ -287,54 +338,125 @@ class MainWindow(QMainWindow):
     def receive_battery(self, battery: int) -> None:
         self.lbl_battery_1.setText(f'{battery} %')
 
-    @Slot(tuple)
-    def receive_raw_emg(self, data_raw_emg: tuple):
+    @Slot(int)
+    def receive_raw_emg_dropped(self, num_samples: int) -> None:
+        # the stream stalled for too long, the recording misses these samples
+        self._append_console(f'EMG stream stalled, {num_samples} samples dropped!')
+
+    @Slot(object)
+    def receive_raw_emg(self, data_raw_emg: np.ndarray) -> None:
+        # a block of N samples of 8 channels (int8), oldest sample first
         self._update_recording_file(data_raw_emg)
         self._update_plot_emg(data_raw_emg)
 
     def _setup_recording_file(self) -> None:
         path = Path(self._dir)
         if not path.exists():
-            self.tbr_console.append(f'Saving directory does not exist! Creating director: {str(self._dir)}...')
+            self._append_console(f'Saving directory does not exist! Creating director: {str(self._dir)}...')
             path.mkdir(parents=True, exist_ok=True)
-            self.tbr_console.append('Finished creating directory!')
-        self.filename = f'{self.gesture}_{self.repetition}.csv'
-        with open(str(path / self.filename), 'w') as f:
-            f.write(','.join([f'channel{i}' for i in range(8)]))
-
-    def _update_plot_emg(self, data_raw_emg: tuple) -> None:
-        for i in range(8):
-            self.curve_emgs[i].appendleft(data_raw_emg[0][i])
-            self.curve_emgs[i].appendleft(data_raw_emg[1][i])
-            self.plot_emgs[i].setData(self.curve_emgs[i])
-        time.sleep(0.005)
-
-    def _update_recording_file(self, data_raw_emg: tuple) -> None:
+            self._append_console('Finished creating directory!')
+        self.filename  = f'{self.gesture}_{self.repetition}.csv'
+        self._csv_path = str(path / self.filename)
+        # keep the file open while recording, the 64 KiB buffer batches the writes
+        self._csv_fh = open(self._csv_path, 'wb', buffering=1 << 16)
+        self._csv_fh.write(','.join([f'channel{i}' for i in range(8)]).encode() + b'\n')
+        # the file is written by a worker thread, the GUI thread only enqueues formatted rows
+        self._csv_queue    = queue.Queue(maxsize=CSV_QUEUE_SIZE)
+        self._csv_executor = ThreadPoolExecutor(max_workers=1)
+        self._csv_future   = self._csv_executor.submit(self._write_recording_file, self._csv_fh, self._csv_queue)
+
+    @staticmethod
+    def _write_recording_file(csv_fh: BufferedWriter, csv_queue: queue.Queue) -> None:
         try:
-            with open(str(Path(self._dir) / self.filename), 'a') as f:
-                f.write('\n' + ','.join([str(emg) for emg in data_raw_emg[0]]))
-                f.write('\n' + ','.join([str(emg) for emg in data_raw_emg[1]]))
-        except IOError:
-            self.tbr_console.append(f'Failed recording file!')
+            # `None` is the sentinel sent when the recording stops
+            rows = csv_queue.get()
+            while rows is not None:
+                csv_fh.write(rows)
+                rows = csv_queue.get()
+        finally:
+            csv_fh.close()
+
+    def _update_plot_emg(self, data_raw_emg: np.ndarray) -> None:
+        # the ring is filled backwards so that the newest sample is displayed first
+        emgs = data_raw_emg[::-1][:self.sample_displayed].T
+        n    = emgs.shape[1]
+        idx  = (self._emg_idx - n) % self.sample_displayed
+        head = min(n, self.sample_displayed - idx)
+        np.copyto(self._emg_buf[:, idx:idx + head], emgs[:, :head])
+        np.copyto(self._emg_buf[:, :n - head], emgs[:, head:])
+        self._emg_idx   = idx
+        self._emg_dirty = True
+
+    def _flush_plots(self) -> None:
+        # skip redrawing when no new samples arrived since the last tick
+        if not self._emg_dirty:
+            return
+        self._emg_dirty = False
+
+        idx     = self._emg_idx
+        emg_buf = self._emg_buf
+        if idx == 0:
+            curve_emgs = emg_buf
+        else:
+            # unroll into the preallocated view instead of concatenating a new array
+            curve_emgs = self._emg_view
+            np.copyto(curve_emgs[:, :self.sample_displayed - idx], emg_buf[:, idx:])
+            np.copyto(curve_emgs[:, self.sample_displayed - idx:], emg_buf[:, :idx])
+        for set_data, curve_emg in zip(self._emg_setdatas, curve_emgs):
+            set_data(curve_emg)
+
+    def _update_recording_file(self, data_raw_emg: np.ndarray) -> None:
+        if self._csv_queue is None:
+            return
+        # a dead writer (disk full, I/O error) drains nothing, stop recording instead of queueing rows
+        if self._csv_future.done():
+            self._append_console('Recording file writer stopped!')
+            self._stop_recording()
+            return
+        # format the int8 samples through the lookup table, one CSV row per 8 bytes
+        raw = data_raw_emg.tobytes()
+        rows = b''.join([b','.join([EMG_ITOA[b] for b in raw[i:i + 8]]) + b'\n' for i in range(0, len(raw), 8)])
+        try:
+            self._csv_queue.put_nowait(rows)
+        except queue.Full:
+            self._append_console('Recording file writer cannot keep up!')
+            self._stop_recording()
+
+    def _close_recording_file(self) -> None:
+        if self._csv_executor is None:
+            return
+        # stop the writer and wait until the queued rows are written (nothing to stop if it already died)
+        if not self._csv_future.done():
+            self._csv_queue.put(None)
+        self._csv_executor.shutdown(wait=True)
+        if self._csv_future.exception() is not None:
+            self._append_console(f'Failed recording file!')
+        else:
+            self._append_console(f'Saved file: {self._csv_path}')
+
+        self._csv_fh       = None
+        self._csv_queue    = None
+        self._csv_executor = None
+        self._csv_future   = None
 
     def _reset_emg_plot(self) -> None:
-        # reset plots
-        del self.curve_emgs
-        gc.collect()
-        self.curve_emgs = list()
+        # reset plots, the ring buffer is zeroed in place instead of being reallocated
+        self._emg_buf.fill(0)
+        self._emg_idx   = 0
+        self._emg_dirty = False
         for i in range(8):
-            self.curve_emgs.append(deque(self.sample_displayed * [0], maxlen=self.sample_displayed))
-            self.plot_emgs[i].setData(self.curve_emgs[-1])
+            self.plot_emgs[i].setData(self._emg_buf[i])
 
     async def _init_device(self, address: str) -> None:
         if isinstance(self._myo, QMyo):
-            await self._myo.connect_device(address)
+            await self._myo.connect_device(address, high_priority=self.chk_priority.isChecked())
         else:
             loop_myo = asyncio.get_event_loop()
             self._myo = QMyo(loop_myo)
             self._myo.signal_connected.connect(self.receive_connected)
+            self._myo.signal_raw_emg_dropped.connect(self.receive_raw_emg_dropped)
             self.signal_streamed.connect(self._myo.receive_streamed)
-            await self._myo.connect_device(address)
+            await self._myo.connect_device(address, high_priority=self.chk_priority.isChecked())
             self._myo.signal_battery.connect(self.receive_battery)
             self._myo.ensure_send_battery()
 
@@ -344,12 +466,16 @@ class MainWindow(QMainWindow):
 
     @asyncSlot()
     async def handle_discover(self) -> None:
-        self.tbr_console.append('Started discover...')
+        self._append_console('Started discover...')
         devices = await BleakScanner.discover()
-        self.cbx_device.clear()
-        for i, device in enumerate(devices):
-            self.cbx_device.insertItem(i, device.name, device)
-        self.tbr_console.append('Finnish discovered!')
+        # fill a new model and swap it in at once, instead of one insertion per device
+        model = QStandardItemModel(self.cbx_device)
+        for device in devices:
+            item = QStandardItem(device.name or device.address)
+            item.setData(device, Qt.UserRole)
+            model.appendRow(item)
+        self.cbx_device.setModel(model)
+        self._append_console('Finnish discovered!')
 
     @asyncSlot()
     async def handle_connect(self) -> None:
@@ -358,23 +484,27 @@ class MainWindow(QMainWindow):
         self.btn_discover.setEnabled(False)
         #
         self.cbx_device.setEnabled(False)
+        self.chk_priority.setEnabled(False)
         #
         self.lne_gesture.setEnabled(False)
         self.lne_repetition.setEnabled(False)
 
         # try connecting the selected device
-        self.tbr_console.append('Try connecting...')
+        self._append_console('Try connecting...')
+        if self.chk_priority.isChecked():
+            self._append_console('Low latency: requesting a short connection interval (adapter-wide on Linux)')
         device = self.cbx_device.currentData()
         if isinstance(device, BLEDevice):
             await self._init_device(device.address)
         else:
-            self.tbr_console.append(f'Actually not bluetooth device! Try discovering devices')
+            self._append_console(f'Actually not bluetooth device! Try discovering devices')
 
             # activate/deactivate some buttons and text boxes
             self.btn_dir.setEnabled(True)
             self.btn_discover.setEnabled(True)
             #
             self.cbx_device.setEnabled(True)
+            self.chk_priority.setEnabled(True)
             #
             self.lne_gesture.setEnabled(True)
             self.lne_repetition.setEnabled(True)
@@ -382,7 +512,7 @@ class MainWindow(QMainWindow):
         print(self._connected)
 
         if self._connected:
-            self.tbr_console.append('Connected!')
+            self._append_console('Connected!')
 
             # activate/deactivate some buttons and text boxes
             self.btn_conn.setEnabled(False)
@@ -390,13 +520,14 @@ class MainWindow(QMainWindow):
             self.btn_start.setEnabled(True)
             self.btn_save.setEnabled(True)
         else:
-            self.tbr_console.append(f'Cannot connect the device!')
+            self._append_console(f'Cannot connect the device!')
 
             # activate/deactivate some buttons and text boxes
             self.btn_dir.setEnabled(True)
             self.btn_discover.setEnabled(True)
             #
             self.cbx_device.setEnabled(True)
+            self.chk_priority.setEnabled(True)
             #
             self.lne_gesture.setEnabled(True)
             self.lne_repetition.setEnabled(True)
@@ -404,7 +535,7 @@ class MainWindow(QMainWindow):
     @asyncSlot()
     async def handle_disconnect(self) -> None:
         # try disconnecting the connected device
-        self.tbr_console.append('Disconnect device...')
+        self._append_console('Disconnect device...')
 
         # un-streaming EMG data
         if self._streamed:
@@ -414,7 +545,7 @@ class MainWindow(QMainWindow):
         if isinstance(self._myo, QMyo):
             await self._myo.disconnect_device()
         else:
-            self.tbr_console.append(f'No connected bluetooth device! Try discovering devices')
+            self._append_console(f'No connected bluetooth device! Try discovering devices')
 
             # activate/deactivate some buttons and text boxes
             self.btn_dir.setEnabled(True)
@@ -425,6 +556,7 @@ class MainWindow(QMainWindow):
             self.btn_save.setEnabled(False)
             #
             self.cbx_device.setEnabled(True)
+            self.chk_priority.setEnabled(True)
             #
             self.lne_gesture.setEnabled(True)
             self.lne_repetition.setEnabled(True)
@@ -432,7 +564,7 @@ class MainWindow(QMainWindow):
         print(self._connected)
 
         if not self._connected:
-            self.tbr_console.append('Disconnected!')
+            self._append_console('Disconnected!')
 
             # activate/deactivate some buttons and text boxes
             self.btn_dir.setEnabled(True)
@@ -443,6 +575,7 @@ class MainWindow(QMainWindow):
             self.btn_save.setEnabled(False)
             #
             self.cbx_device.setEnabled(True)
+            self.chk_priority.setEnabled(True)
             #
             self.lne_gesture.setEnabled(True)
             self.lne_repetition.setEnabled(True)
@@ -451,10 +584,10 @@ class MainWindow(QMainWindow):
             self._reset_emg_plot()
 
         else:
-            self.tbr_console.append('Try disconnecting again!')
+            self._append_console('Try disconnecting again!')
 
     def handle_start(self) -> None:
-        self.tbr_console.append(f'Start recording...')
+        self._append_console(f'Start recording...')
 
         # setup recording file
         self._setup_recording_file()
@@ -466,7 +599,7 @@ class MainWindow(QMainWindow):
 
         # start stream EMG data
         if not self.first_start:
-            self._myo.signal_raw_emg.connect(self.receive_raw_emg)
+            self._myo.bind_raw_emg(self.receive_raw_emg)
             self._myo.ensure_stream_raw_emg()
             self.first_start = True
 
@@ -479,17 +612,23 @@ class MainWindow(QMainWindow):
         self.lne_gesture.setEnabled(False)
         self.lne_repetition.setEnabled(False)
 
-        self.tbr_console.append('Recording!')
+        self._append_console('Recording!')
 
     @asyncSlot()
     async def handle_save(self):
-        self.tbr_console.append(f'Stop recording and save file...')
+        self._stop_recording()
+
+    def _stop_recording(self) -> None:
+        self._append_console(f'Stop recording and save file...')
         if self._streamed:
             self._streamed = False
             self.signal_streamed.emit(self._streamed)
 
         # print(self._streamed)
 
+        # write the remaining samples and close the recording file
+        self._close_recording_file()
+
         # reset EMG plot
         self._reset_emg_plot()
 
@@ -502,7 +641,7 @@ class MainWindow(QMainWindow):
         self.lne_gesture.setEnabled(True)
         self.lne_repetition.setEnabled(True)
 
-        self.tbr_console.append('Stopped!')
+        self._append_console('Stopped!')
 
     def handle_editingfinished_gesture(self) -> None:
         self.gesture = self.lne_gesture.text()
@@ -531,6 +670,8 @@ class MainWindow(QMainWindow):
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     loop = QEventLoop(app)
+    # skip the Python-level wrapper around time.monotonic() in the loop scheduling
+    loop.time = time.monotonic
     asyncio.set_event_loop(loop)
     window = MainWindow()
     window.show()
@@ -24,11 +24,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-import gc
 import sys
 import asyncio
 from asyncio import AbstractEventLoop
 import bleak
+from PySide6.QtGui import QStandardItemModel, QStandardItem
+from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QApplication, QMainWindow, QWidget
 from PySide6.QtWidgets import QVBoxLayout
 from PySide6.QtWidgets import QPushButton, QComboBox, QTextBrowser
@@ -86,9 +87,13 @@ class MainWindow(QMainWindow):
     async def handle_discover(self) -> None:
         self.tbr_console.append('Started discover...')
         devices = await BleakScanner.discover()
-        self.cbx_device.clear()
-        for i, device in enumerate(devices):
-            self.cbx_device.insertItem(i, device.name, device)
+        # fill a new model and swap it in at once, instead of one insertion per device
+        model = QStandardItemModel(self.cbx_device)
+        for device in devices:
+            item = QStandardItem(device.name or device.address)
+            item.setData(device, Qt.UserRole)
+            model.appendRow(item)
+        self.cbx_device.setModel(model)
         self.tbr_console.append('Finnish discovered!')
 
         if not self._is_connected:
@@ -130,8 +135,6 @@ class MainWindow(QMainWindow):
             except bleak.BleakError:
                 pass
 
-            del self._device
-            gc.collect()
             self._device = None
 
 
@@ -24,9 +24,13 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from typing import Union, Optional, Type, Callable, Any
+from typing import Union, Optional, Callable, Any
+import sys
 import struct
+import logging
 import asyncio
+from collections import deque
+import numpy as np
 import bleak
 from async_property import async_property
 from bleak import BleakClient
@@ -37,11 +41,49 @@ from .defines import *
 
 __all__ = ['QMyo']
 
+logger = logging.getLogger(__name__)
+
+# raw EMG notification handles, as plain ints
+_RAW_HANDLES = frozenset(int(handle) for handle in (NotifHandle.EMG_0, NotifHandle.EMG_1, NotifHandle.EMG_2, NotifHandle.EMG_3))
+
+# GATT characteristic specifiers, handles as plain ints
+_HANDLE_BATTERY   = int(InfoHandle.BATTERY)
+_HANDLE_INFO      = int(InfoHandle.INFO)
+_HANDLE_FIRMWARE  = int(InfoHandle.FIRMWARE)
+_HANDLE_COMMAND   = int(InfoHandle.COMMAND)
+_UUID_DEVICE_NAME = '00002a00-0000-1000-8000-00805f9b34fb'
+
+# precompiled packers/unpackers, avoid reparsing the format string on every call
+_CMD_3B   = struct.Struct('<3B')
+_CMD_5B   = struct.Struct('<5B')
+_CMD_8B   = struct.Struct('<8B')
+_CMD_VIB2 = struct.Struct('<2B' + 6 * 'HB')
+_INFO     = struct.Struct('<6sH5B7x')
+_FIRMWARE = struct.Struct('<4H')
+
+# pre-baked commands for every mode value, the modes are small enums so the commands are built once
+# keyed by plain ints so lookups do not go through the enum machinery
+_CMD_SET_MODE    = {(int(emg), int(imu), int(clf)): _CMD_5B.pack(CommandHandle.SET_MODE, 3, emg, imu, clf)
+                    for emg in EmgMode for imu in ImuMode for clf in ClassifierMode}
+_CMD_VIBRATE     = {int(mode): _CMD_3B.pack(CommandHandle.VIBRATE, 1, mode) for mode in VibrationMode}
+_CMD_SLEEP_MODE  = {int(mode): _CMD_3B.pack(CommandHandle.SET_SLEEP_MODE, 1, mode) for mode in SleepMode}
+_CMD_UNLOCK      = {int(mode): _CMD_3B.pack(CommandHandle.UNLOCK, 1, mode) for mode in UnlockMode}
+_CMD_USER_ACTION = {int(mode): _CMD_3B.pack(CommandHandle.USER_ACTION, 1, mode) for mode in UserActionMode}
+
+# preferred connection interval, in units of 1.25 ms (7.5 - 15 ms)
+CONN_MIN_INTERVAL = 6
+CONN_MAX_INTERVAL = 12
+
+# number of raw EMG notifications kept while the GUI is stalled, the oldest ones are dropped beyond it
+RAW_EMG_QUEUE_SIZE = 256
+
 
 class QMyo(QObject):
     signal_connected = Signal(bool)
     signal_battery   = Signal(int)
-    signal_raw_emg   = Signal(tuple)
+    signal_raw_emg   = Signal(object)
+    # number of raw EMG samples dropped while the consumer was stalled
+    signal_raw_emg_dropped = Signal(int)
 
     def __init__(self, loop: asyncio.AbstractEventLoop, parent: QObject = None) -> None:
         """
@@ -54,8 +96,14 @@ class QMyo(QObject):
 
         self._reset()
         self._loop = loop
-        self._handle_raw_emgs = [NotifHandle.EMG_0, NotifHandle.EMG_1, NotifHandle.EMG_2, NotifHandle.EMG_3]
-        self._handle_imu = [NotifHandle.IMU]
+        # plain int handles, bleak looks them up in its characteristic dict
+        self._handle_raw_emgs = [int(NotifHandle.EMG_0), int(NotifHandle.EMG_1), int(NotifHandle.EMG_2), int(NotifHandle.EMG_3)]
+        self._handle_imu = [int(NotifHandle.IMU)]
+        # pre-bound raw EMG sender, replaced by a plain slot with `bind_raw_emg()`
+        self._emit_raw_emg = self.signal_raw_emg.emit
+        # connection priority state, kept across `_reset()` so the adapter defaults can always be restored
+        self._high_priority          = False
+        self._conn_interval_defaults = {}
 
     def _reset(self) -> None:
         """
@@ -65,20 +113,21 @@ class QMyo(QObject):
         """
 
         self._name             = ''
-        self._basic_info       = BasicInfo
-        self._firmware_version = FirmwareVersion
-
-        self._queue_raw_emg  = asyncio.Queue()
-        self._queue_filt_emg = asyncio.Queue()
-        self._queue_imu      = asyncio.Queue()
-
-        self._data_raw_emg  = tuple()
-        self._data_filt_emg = tuple()
-
-        self._device    = None
-        self._connected = False
-        self._streamed  = False
-        self._loop      = None
+        self._basic_info       = None
+        self._firmware_version = None
+
+        self._deque_raw_emg   = deque(maxlen=RAW_EMG_QUEUE_SIZE)
+        self._dropped_raw_emg = 0
+        self._event_raw_emg = asyncio.Event()
+        self._data_raw_emg  = np.empty((0, 8), dtype=np.int8)
+
+        self._device             = None
+        self._chars              = {}
+        self._event_disconnected = asyncio.Event()
+        self._mtu                = 23
+        self._connected          = False
+        self._streamed           = False
+        self._loop               = None
 
     @Slot(bool)
     def receive_streamed(self, streamed: bool) -> None:
@@ -90,15 +139,26 @@ class QMyo(QObject):
 
         self._streamed = streamed
 
-    async def _run_command(self, data: Union[bytes, bytearray, memoryview]) -> None:
+    def bind_raw_emg(self, slot: Callable[[np.ndarray], Any]) -> None:
+        """
+        Send raw EMG data straight to a slot living in the same thread, skipping the `signal_raw_emg` dispatch
+
+        :param slot: the slot receiving each (N, 8) int8 block of samples
+        :return:
+        """
+
+        self._emit_raw_emg = slot
+
+    async def _run_command(self, data: Union[bytes, bytearray, memoryview], response: bool = False) -> None:
         """
         Run command based on the specific GATT characteristic
 
         :param data: data to send
+        :param response: wait for the write response of Myo device. Default: `False`
         :return:
         """
 
-        await self._device.write_gatt_char(InfoHandle.COMMAND, data)
+        await self._device.write_gatt_char(self._chars.get(_HANDLE_COMMAND, _HANDLE_COMMAND), data, response=response)
 
     async def _read_data(self, char_specifier: Union[BleakGATTCharacteristic, int, str, UUID]) -> bytearray:
         """
@@ -108,7 +168,7 @@ class QMyo(QObject):
         :return:
         """
 
-        return await self._device.read_gatt_char(char_specifier)
+        return await self._device.read_gatt_char(self._chars.get(char_specifier, char_specifier))
 
     async def _start_subscription(self, handles: list[int], callback: Optional[Callable[..., Any]] = None) -> None:
         """
@@ -123,8 +183,7 @@ class QMyo(QObject):
             def callback(sender: int, data: bytearray):
                 print(f'{sender}: {data}')
 
-        for handle in handles:
-            await self._device.start_notify(handle, callback)
+        await asyncio.gather(*[self._device.start_notify(self._chars.get(handle, handle), callback) for handle in handles])
 
     async def _stop_subscription(self, handles: list[int]) -> None:
         """
@@ -135,39 +194,50 @@ class QMyo(QObject):
         """
 
         for handle in handles:
-            await self._device.stop_notify(handle)
+            await self._device.stop_notify(self._chars.get(handle, handle))
 
-    async def _callback_raw_emg(self, sender: int, data: bytearray) -> None:
+    def _resolve_characteristics(self) -> None:
         """
-        Callback function to get raw EMG data
+        Resolve the used characteristics once after connection,
+        bleak then gets the characteristic objects instead of searching the services on every request
+
+        :return:
+        """
+
+        specifiers = [_HANDLE_BATTERY, _HANDLE_INFO, _HANDLE_FIRMWARE, _HANDLE_COMMAND, _UUID_DEVICE_NAME]
+        specifiers += self._handle_raw_emgs + self._handle_imu
+        for specifier in specifiers:
+            char = self._device.services.get_characteristic(specifier)
+            if char is not None:
+                self._chars[specifier] = char
+
+    def _callback_raw_emg(self, sender: int, data: bytearray) -> None:
+        """
+        Callback function to get raw EMG data, the packets are decoded by `stream_raw_emg()`
 
         :param sender: the handle to send
         :param data: the data
         :return:
         """
 
-        if sender not in [NotifHandle.EMG_0, NotifHandle.EMG_1, NotifHandle.EMG_2, NotifHandle.EMG_3]:
+        if sender not in _RAW_HANDLES:
             raise ValueError(f'Incorrect raw EMG handles. Got {sender} handle.')
 
-        idx = 0
-        if sender == NotifHandle.EMG_0:
-            idx = 0
-        elif sender == NotifHandle.EMG_1:
-            idx = 1
-        elif sender == NotifHandle.EMG_2:
-            idx = 2
-        elif sender == NotifHandle.EMG_3:
-            idx = 3
+        # only hand over the packet, keep the callback short so the next notification is not delayed
+        deque_raw_emg = self._deque_raw_emg
+        if len(deque_raw_emg) == RAW_EMG_QUEUE_SIZE:
+            # the oldest packet is evicted, count it so that the gap is reported
+            self._dropped_raw_emg += 1
+        deque_raw_emg.append(data)
+        self._event_raw_emg.set()
 
-        emg = struct.unpack('<16b', data)
-        await self._queue_raw_emg.put((idx, emg))
-
-    async def connect_device(self, address: str, **kwargs) -> None:
+    async def connect_device(self, address: str, high_priority: bool = False, **kwargs) -> None:
         """
         Connect to Myo device
 
         :param address: the MAC address
-        :param kwargs:
+        :param high_priority: request a short connection interval, see `set_connection_priority()`. Default: `False`
+        :param kwargs: passed to `BleakClient` (e.g. `adapter='hci1'` on Linux)
         :return:
         """
 
@@ -175,11 +245,20 @@ class QMyo(QObject):
         try:
             if not self._connected:
                 self._device = BleakClient(address, **kwargs)
+                # BlueZ reads the connection interval when the connection is created, Windows once it is connected
+                if high_priority and sys.platform.startswith('linux'):
+                    await self.set_connection_priority(high=True)
                 await self._device.connect()
+                await self._request_mtu()
+                self._resolve_characteristics()
+                if high_priority and sys.platform == 'win32':
+                    await self.set_connection_priority(high=True)
 
                 self._connected = True
         except bleak.BleakError:
             self._connected = False
+            if self._high_priority:
+                await self.set_connection_priority(high=False)
 
         # get basic information from Myo device
         await self.read_device_name()
@@ -191,12 +270,151 @@ class QMyo(QObject):
 
         self.signal_connected.emit(self._connected)
 
+    async def set_connection_priority(self, high: bool = True) -> None:
+        """
+        Request a short connection interval (7.5 - 15 ms) so that EMG notifications are not bunched, or the default one.
+        On Windows (11 only), the request applies to the connected device.
+        On Linux, BlueZ has no API for it: the defaults of the adapter are written in debugfs (root only),
+        they are read when a connection is created and apply to every later LE connection of the adapter,
+        so the previous defaults are saved and restored with `high=False` (called by `disconnect_device()`).
+
+        :param high: whether to request a short connection interval or the default one. Default: `True`
+        :return:
+        """
+
+        if sys.platform == 'win32':
+            self._set_conn_priority_windows(high)
+        elif sys.platform.startswith('linux'):
+            if high:
+                await self._set_conn_interval_linux()
+            else:
+                self._restore_conn_interval_linux()
+        else:
+            logger.info('Connection priority is not supported on %s, skipped.', sys.platform)
+        self._high_priority = high
+
+    async def _resolve_adapter(self) -> Optional[str]:
+        """
+        Name of the BlueZ adapter used by the client (e.g. `hci0`)
+
+        :return:
+        """
+
+        backend = getattr(self._device, '_backend', None)
+        adapter = getattr(backend, '_adapter', None)
+        if adapter:
+            return adapter
+        # set when the client is created from a BLEDevice, e.g. /org/bluez/hci0/dev_XX_XX_XX_XX_XX_XX
+        device_path = getattr(backend, '_device_path', None)
+        if device_path:
+            return device_path.split('/')[3]
+        # otherwise BlueZ uses its default adapter
+        try:
+            from bleak.backends.bluezdbus.manager import get_global_bluez_manager
+            manager = await get_global_bluez_manager()
+            return manager.get_default_adapter().split('/')[-1]
+        except (ImportError, AttributeError, OSError, bleak.BleakError):
+            return None
+
+    async def _set_conn_interval_linux(self) -> None:
+        """
+        Write the short connection interval in the debugfs defaults of the adapter, saving the previous values.
+
+        :return:
+        """
+
+        if self._conn_interval_defaults:
+            # already set, keep the saved defaults
+            return
+        adapter = await self._resolve_adapter()
+        if adapter is None:
+            logger.info('No Bluetooth adapter found, connection priority skipped.')
+            return
+        # min first: the kernel rejects a min interval above the max one
+        for name, value in (('conn_min_interval', CONN_MIN_INTERVAL), ('conn_max_interval', CONN_MAX_INTERVAL)):
+            path = f'/sys/kernel/debug/bluetooth/{adapter}/{name}'
+            try:
+                with open(path) as f:
+                    default = f.read().strip()
+                with open(path, 'w') as f:
+                    f.write(str(value))
+            except OSError as e:
+                logger.info('Cannot write %s (%s), connection priority skipped.', path, e)
+                self._restore_conn_interval_linux()
+                return
+            self._conn_interval_defaults[path] = default
+
+    def _restore_conn_interval_linux(self) -> None:
+        """
+        Restore the debugfs defaults saved by `_set_conn_interval_linux()`.
+
+        :return:
+        """
+
+        # max first, in reverse order of writing
+        for path, default in reversed(list(self._conn_interval_defaults.items())):
+            try:
+                with open(path, 'w') as f:
+                    f.write(default)
+            except OSError as e:
+                logger.warning('Cannot restore %s to %s (%s).', path, default, e)
+        self._conn_interval_defaults = {}
+
+    def _set_conn_priority_windows(self, high: bool) -> None:
+        """
+        Ask Windows for a short or the default connection interval on the connected device (Windows 11 only).
+
+        :param high: whether to request a short connection interval or the default one
+        :return:
+        """
+
+        try:
+            from winrt.windows.devices.bluetooth import BluetoothLEPreferredConnectionParameters
+        except ImportError:
+            try:
+                from bleak_winrt.windows.devices.bluetooth import BluetoothLEPreferredConnectionParameters
+            except ImportError:
+                logger.info('WinRT Bluetooth API not found, connection priority skipped.')
+                return
+        if high:
+            parameters = BluetoothLEPreferredConnectionParameters.throughput_optimized
+        else:
+            parameters = BluetoothLEPreferredConnectionParameters.balanced
+        requester = getattr(getattr(self._device, '_backend', None), '_requester', None)
+        try:
+            requester.request_preferred_connection_parameters(parameters)
+        except (AttributeError, OSError):
+            # older Windows versions do not support connection parameter requests
+            logger.info('Connection parameter requests are not supported, connection priority skipped.')
+
+    async def _request_mtu(self) -> None:
+        """
+        Request a larger ATT MTU so that notifications are not fragmented over several PDUs.
+        WinRT and CoreBluetooth negotiate the MTU on their own, only BlueZ needs an explicit request.
+
+        :return:
+        """
+
+        acquire_mtu = getattr(getattr(self._device, '_backend', None), '_acquire_mtu', None)
+        if acquire_mtu is not None:
+            try:
+                await acquire_mtu()
+            except (bleak.BleakError, RuntimeError):
+                # older BlueZ versions do not expose the MTU, keep the default one
+                pass
+        self._mtu = self._device.mtu_size
+
     async def disconnect_device(self) -> None:
         """
         Disconnect to Myo device
 
         :return:
         """
+
+        # wake up and stop the EMG streaming task
+        self._event_disconnected.set()
+        self._event_raw_emg.set()
+
         try:
             if self._connected:
                 await self.vibrate(VibrationMode.LONG)
@@ -206,6 +424,10 @@ class QMyo(QObject):
         except bleak.BleakError:
             self._connected = True
 
+        # the adapter defaults would otherwise apply to every later connection
+        if self._high_priority:
+            await self.set_connection_priority(high=False)
+
         self._reset()
 
         self.signal_connected.emit(self._connected)
@@ -221,8 +443,8 @@ class QMyo(QObject):
         """
 
         # set Myo recording mode
-        command = struct.pack('<5B', CommandHandle.SET_MODE, 3, emg_mode, imu_mode, clf_mode)
-        await self._run_command(command)
+        command = _CMD_SET_MODE[emg_mode, imu_mode, clf_mode]
+        await self._run_command(command, response=True)
 
     async def vibrate(self, vibrate_mode: VibrationMode.SHORT) -> None:
         """
@@ -232,7 +454,7 @@ class QMyo(QObject):
         :return:
         """
 
-        command = struct.pack('<3B', CommandHandle.VIBRATE, 1, vibrate_mode)
+        command = _CMD_VIBRATE[vibrate_mode]
         await self._run_command(command)
 
     async def deep_sleep(self) -> None:
@@ -250,7 +472,7 @@ class QMyo(QObject):
         :return:
         """
 
-        await self._run_command(b'\x04\x00')
+        await self._run_command(b'\x04\x00', response=True)
 
     async def set_led_color(self, rgb_logo: tuple[int, int, int], rgb_line: tuple[int, int, int]) -> None:
         """
@@ -261,7 +483,7 @@ class QMyo(QObject):
         :return:
         """
 
-        await self._run_command(struct.pack('<8B', CommandHandle.SET_LED, 6, *rgb_logo, *rgb_line))
+        await self._run_command(_CMD_8B.pack(CommandHandle.SET_LED, 6, *rgb_logo, *rgb_line))
 
     async def vibrate2(self, steps: tuple[tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int], tuple[int, int]]) -> None:
         """
@@ -271,7 +493,7 @@ class QMyo(QObject):
         :return:
         """
 
-        command = struct.pack('<2B' + 6 * 'HB', CommandHandle.VIBRATE2, 20, *sum(steps, ()))
+        command = _CMD_VIB2.pack(CommandHandle.VIBRATE2, 20, *sum(steps, ()))
         await self._run_command(command)
 
     async def set_sleep_mode(self, sleep_mode: SleepMode.NEVER_SLEEP) -> None:
@@ -282,8 +504,8 @@ class QMyo(QObject):
         :return:
         """
 
-        command = struct.pack('<3B', CommandHandle.SET_SLEEP_MODE, 1, sleep_mode)
-        await self._run_command(command)
+        command = _CMD_SLEEP_MODE[sleep_mode]
+        await self._run_command(command, response=True)
 
     async def unlock_device(self, unlock_mode: UnlockMode = UnlockMode.HOLD) -> None:
         """
@@ -293,8 +515,8 @@ class QMyo(QObject):
         :return:
         """
 
-        command = struct.pack('<3B', CommandHandle.UNLOCK, 1, unlock_mode)
-        await self._run_command(command)
+        command = _CMD_UNLOCK[unlock_mode]
+        await self._run_command(command, response=True)
 
     async def user_action(self, user_mode: UserActionMode.SINGLE) -> None:
         """
@@ -304,7 +526,7 @@ class QMyo(QObject):
         :return:
         """
 
-        command = struct.pack('<3B', CommandHandle.USER_ACTION, 1, user_mode)
+        command = _CMD_USER_ACTION[user_mode]
         await self._run_command(command)
 
     async def read_device_name(self) -> None:
@@ -314,7 +536,7 @@ class QMyo(QObject):
         :return:
         """
 
-        self._name = (await self._read_data('00002a00-0000-1000-8000-00805f9b34fb')).decode()
+        self._name = (await self._read_data(_UUID_DEVICE_NAME)).decode()
 
     async def read_basic_info(self) -> None:
         """
@@ -323,8 +545,8 @@ class QMyo(QObject):
         :return:
         """
 
-        data = await self._read_data(InfoHandle.INFO)
-        info = struct.unpack('<6sH5B7x', data)
+        data = await self._read_data(_HANDLE_INFO)
+        info = _INFO.unpack(data)
 
         self._basic_info = BasicInfo(serial_number=info[0],
                                      unlock_pose=Pose(info[1]),
@@ -341,8 +563,8 @@ class QMyo(QObject):
         :return:
         """
 
-        data = await self._read_data(InfoHandle.FIRMWARE)
-        firmware = struct.unpack('<4H', data)
+        data = await self._read_data(_HANDLE_FIRMWARE)
+        firmware = _FIRMWARE.unpack(data)
 
         self._firmware_version = FirmwareVersion(major=firmware[0],
                                                  minor=firmware[1],
@@ -358,7 +580,7 @@ class QMyo(QObject):
 
         try:
             while self._connected:
-                self.signal_battery.emit(ord(await self._read_data(InfoHandle.BATTERY)))
+                self.signal_battery.emit((await self._read_data(_HANDLE_BATTERY))[0])
         except bleak.BleakError:
             pass
 
@@ -372,22 +594,34 @@ class QMyo(QObject):
         try:
             # print(self._streamed)
 
-            # set device modes
-            await self.unlock_device(UnlockMode.HOLD)
-            await self.set_mode(EmgMode.FILT)
-
-            # subscribe EMG notifications
+            # set device modes, then subscribe EMG notifications: each group is issued concurrently,
+            # but the subscriptions assume the mode is already applied (some firmwares drop notifications
+            # enabled before set_mode), so they only start once both mode writes are acknowledged
+            await asyncio.gather(self.unlock_device(UnlockMode.HOLD),
+                                 self.set_mode(EmgMode.FILT))
             await self._start_subscription(self._handle_raw_emgs, self._callback_raw_emg)
 
-            while self._connected:
-                if self._queue_raw_emg.qsize() > 0:
-                    char_received, emg = await self._queue_raw_emg.get()
-                    self._data_raw_emg = (emg[:8], emg[8:])
-                    if self._streamed:
-                        # send data when click Start button in GUI
-                        self.signal_raw_emg.emit(self._data_raw_emg)
-                else:
-                    await asyncio.sleep(0.0001)
+            # `_reset()` replaces them on disconnection, keep the ones being consumed
+            deque_raw_emg      = self._deque_raw_emg
+            event_raw_emg      = self._event_raw_emg
+            event_disconnected = self._event_disconnected
+            while not event_disconnected.is_set():
+                await event_raw_emg.wait()
+                event_raw_emg.clear()
+                n = len(deque_raw_emg)
+                if n == 0:
+                    continue
+
+                # decode every pending packet at once into one (N, 8) block of samples
+                batch = [deque_raw_emg.popleft() for _ in range(n)]
+                if self._dropped_raw_emg:
+                    # 2 samples per notification
+                    self.signal_raw_emg_dropped.emit(2 * self._dropped_raw_emg)
+                    self._dropped_raw_emg = 0
+                self._data_raw_emg = np.frombuffer(b''.join(batch), dtype=np.int8).reshape(-1, 8)
+                if self._streamed:
+                    # send data when click Start button in GUI
+                    self._emit_raw_emg(self._data_raw_emg)
 
             if isinstance(self._device, BLEDevice):
                 await self._stop_subscription(self._handle_raw_emgs)
@@ -423,12 +657,12 @@ class QMyo(QObject):
         :return:
         """
 
-        return ord(await self._read_data(InfoHandle.BATTERY))
+        return (await self._read_data(_HANDLE_BATTERY))[0]
 
     @property
-    def basic_info(self) -> Type[BasicInfo]:
+    def basic_info(self) -> Optional[BasicInfo]:
         """
-        Basic information of this Myo
+        Basic information of this Myo, `None` until it is read from the device
 
         :return:
         """
@@ -436,9 +670,9 @@ class QMyo(QObject):
         return self._basic_info
 
     @property
-    def firmware_version(self) -> Type[FirmwareVersion]:
+    def firmware_version(self) -> Optional[FirmwareVersion]:
         """
-        Version information for the Myo firmware
+        Version information for the Myo firmware, `None` until it is read from the device
 
         :return:
         """
@@ -19,8 +19,13 @@ limitations under the License.
 # https://github.com/sebastiankmiec/PythonMyoLinux/pymyolinux
 # See "Bluetooth Smart Software API Reference Manual for BLE Version 1.7" for details.
 
+import os
+import queue
+import select
 import struct
+import threading
 import time
+from functools import lru_cache
 import serial
 from core.handlers import *
 from utils import *
@@ -28,21 +33,83 @@ from utils import *
 
 __all__ = ['BlueGigaProtocol']
 
+# precompiled header and payload formats of the received packets
+_S_HEADER            = struct.Struct('<4B')
+_S_LENGTH            = struct.Struct('>H')     # first two header octets, payload length in the low 11 bits
+
+# header constants read for every received packet, as plain module globals
+_HEADER_LENGTH       = PackageMessages.packet_header_length
+_PACKET_TYPE_BITS    = PackageMessages.packet_type_bits
+_PAYLOAD_LENGTH_MASK = (PackageMessages.packet_length_high_bits << 8) | 0xFF
+_S_H                 = struct.Struct('<H')
+_S_BH                = struct.Struct('<BH')
+_S_HB                = struct.Struct('<HB')
+_S_BHB               = struct.Struct('<BHB')
+_S_BHH               = struct.Struct('<BHH')
+_S_BHBB              = struct.Struct('<BHBB')
+_S_BHHB              = struct.Struct('<BHHB')
+_S_CONNECTION_STATUS = struct.Struct('<BB6sBHHHB')
+_S_SCAN_RESPONSE     = struct.Struct('<bB6sBBB')
+
+# precompiled formats of the transmitted commands (4-byte header + payload)
+_S_CMD                = struct.Struct('<4B')
+_S_CMD_B              = struct.Struct('<4BB')
+_S_CMD_BB             = struct.Struct('<4BBB')
+_S_CMD_BH             = struct.Struct('<4BBH')
+_S_CMD_BHH            = struct.Struct('<4BBHH')
+_S_CMD_CONNECT_DIRECT = struct.Struct('<4B6sBHHHH')
+
+
+@lru_cache(maxsize=16)
+def _s_cmd_read_by_group_type(uuid_len: int) -> struct.Struct:
+    """
+    Format of the read_by_group_type command for a given UUID length.
+
+    :param uuid_len: Length of the UUID
+    :return: Struct object
+    """
+
+    return struct.Struct('<4BBHHB' + str(uuid_len) + 's')
+
+
+@lru_cache(maxsize=16)
+def _s_cmd_attribute_write(data_len: int) -> struct.Struct:
+    """
+    Format of the attribute_write command for a given data length.
+
+    :param data_len: Length of the attribute value
+    :return: Struct object
+    """
+
+    return struct.Struct('<4BBHB' + str(data_len) + 's')
+
 
 class BlueGigaProtocol:
 
-    # configurable
-    debug = False
+    # configurable, through the `debug` property (also after construction)
+    _debug = False
 
     # by default, the BGAPI protocol assumes that UART flow control (RTS/CTS) is used to ensure reliable data
     # transmission and to prevent lost data because of buffer overflows.
     use_rts_cts         = True
     BLED112_BAUD_RATE   = 115200
 
-    # Myo device specific events
-    emg_event           = Event("On receiving an EMG data packet from the Myo device.", is_fire=True)
-    imu_event           = Event("On receiving an IMU data packet from the Myo device.", is_fire=True)
-    joint_emg_imu_event = Event("On receiving an IMU data packet from the Myo device. Use latest IMU event.", is_fire=True)
+    # read the serial port in a background thread, so that slow event handlers do not stall the reads (opt-in:
+    # the thread keeps reading between read_packets() calls, up to READ_QUEUE_SIZE chunks, see close())
+    use_reader_thread   = False
+    READ_QUEUE_SIZE     = 256
+
+    # receive buffer, large enough for a pending partial packet plus a full one (up to 4 + 2047 bytes each)
+    RING_BUFFER_SIZE    = 4096
+
+    # preallocated EMG packet slots, the views handed to EMG handlers are reused after this many packets
+    EMG_SLOT_COUNT      = 256
+
+    # Myo device specific events (streamed data, never waited for, so not counted)
+    emg_event           = Event("On receiving an EMG data packet from the Myo device.", is_fire=True, is_counted=False)
+    imu_event           = Event("On receiving an IMU data packet from the Myo device.", is_fire=True, is_counted=False)
+    joint_emg_imu_event = Event("On receiving an IMU data packet from the Myo device. Use latest IMU event.", is_fire=True, is_counted=False)
+    emg_batch_event     = Event("On receiving a batch of EMG data packets from the Myo device.", is_fire=True, is_counted=False)
 
     # non-empty events
     ble_evt_connection_disconnected     = Event()
@@ -56,16 +123,19 @@ class BlueGigaProtocol:
     ble_rsp_connection_disconnect   = Event()
     ble_rsp_gatt_find_information   = Event()
     ble_rsp_gatt_attribute_write    = Event()
-    ble_evt_gatt_attribute_value    = Event()
+    ble_evt_gatt_attribute_value    = Event("On receiving an attribute value, only fired (and counted for read_packets_conditional()) "
+                                            "for the handles in attribute_dispatch, see build_attribute_dispatch().")
     ble_rsp_gatt_read_by_group_type = Event()
     ble_rsp_gap_end_procedure       = Event()
     ble_rsp_gap_discover            = Event()
     ble_rsp_gap_connect_direct      = Event()
     ble_rsp_gap_set_mode            = Event()
 
+    # valid Message/Technology Types of the first packet byte
+    valid_message_types = (BluetoothMessages.bluetooth_resp, BluetoothMessages.bluetooth_event,
+                           WifiMessages.wifi_resp, WifiMessages.wifi_event)
+
     # States
-    read_buffer                 = b''
-    expected_packet_length      = 0
     busy_reading                = False
     disconnecting               = False
 
@@ -74,6 +144,28 @@ class BlueGigaProtocol:
         self.port           = serial.Serial(port=port, baudrate=self.BLED112_BAUD_RATE, rtscts=self.use_rts_cts)
         self.is_packet_mode = not self.use_rts_cts
 
+        # event counts, incremented by EventHandler.fire() (which looks for `__eventcounter__`)
+        self.__eventcounter__ = self._evt_counts = {}
+
+        # bytes in [ring_head, ring_tail) are read but not parsed yet, packets are parsed in place
+        self.ring_buffer    = bytearray(self.RING_BUFFER_SIZE)
+        self.ring_view      = memoryview(self.ring_buffer)
+        self.ring_head      = 0
+        self.ring_tail      = 0
+
+        # packet mode is fixed from now on, bind the matching transmit function once (and on debug changes)
+        self._bind_transmit_packet()
+
+        # with a reader thread, chunks read from the serial port are parsed from a queue instead
+        if self.use_reader_thread:
+            # bounded, so that a full queue stalls the reader and the serial port applies its flow control again
+            self.read_queue     = queue.Queue(maxsize=self.READ_QUEUE_SIZE)
+            self.reader_wakeup  = os.pipe()
+            self.reader_running = True
+            self.reader_thread  = threading.Thread(target=self._read_serial, name='BlueGigaReader', daemon=True)
+            self.read_bytes     = self._read_bytes_queued
+            self.reader_thread.start()
+
         # filled by user of this object
         self.imu_handler     = None
         self.emg_handler_0   = None
@@ -82,8 +174,27 @@ class BlueGigaProtocol:
         self.emg_handler_3   = None
         self.battery_handler = None
 
+        # attribute handle -> value handler, rebuilt by build_attribute_dispatch() once the handles are known
+        self.attribute_dispatch = {}
+
+        # EMG packet slots, each a pair of 8-sample views into emg_slots (see handlers.receive_emg_value())
+        self.emg_slots      = bytearray(16 * self.EMG_SLOT_COUNT)
+        emg_slots_view      = memoryview(self.emg_slots).cast('b')
+        self.emg_slot_views = [(emg_slots_view[offset:offset + 8], emg_slots_view[offset + 8:offset + 16])
+                               for offset in range(0, len(self.emg_slots), 16)]
+        self.emg_slot_index = 0
+
+        # shared memory rings fed with every EMG packet, batched or not (filled by MyoDongle.add_emg_shared_ring())
+        self.emg_rings = []
+
+        # EMG batching, enabled with emg_batch_size > 0 (filled by MyoDongle.add_emg_batch_handler())
+        self.emg_batch_size   = 0
+        self.emg_batch_buffer = None
+        self.emg_batch_count  = 0
+
         # filled by event handlers
         self.myo_devices      = []
+        self.myo_device_keys  = set()
         self.found_services   = []
         self.found_attributes = []
         self.connection       = None
@@ -99,24 +210,38 @@ class BlueGigaProtocol:
         self.ble_evt_gatt_attribute_value        += receive_attribute_value
         self.ble_evt_gap_scan_response           += add_myo_device
 
-        # empty handlers (solely to increment event fire count)
-        empty_handler_events = [
-            self.ble_rsp_connection_disconnect,
-            self.ble_rsp_gatt_read_by_group_type,
-            self.ble_rsp_gatt_find_information,
-            self.ble_rsp_gatt_attribute_write,
-            self.ble_rsp_gap_end_procedure,
-            self.ble_rsp_gap_discover,
-            self.ble_rsp_gap_connect_direct,
-            self.ble_rsp_gap_set_mode,
-        ]
-
-        for empty_event in empty_handler_events:
-            empty_event += empty_handler
+        # response events need no handlers, Event.fire() counts them for read_packets_conditional() either way
+
+    @property
+    def debug(self) -> bool:
+        """
+        Print the sent and received packets.
+        """
+
+        return self._debug
+
+    @debug.setter
+    def debug(self, debug: bool):
+        self._debug = debug
+        self._bind_transmit_packet()
+
+    def _bind_transmit_packet(self):
+        """
+        Binds transmit_packet() to the function matching the packet mode and the debug flag.
+
+        :return:
+        """
+
+        if self._debug:
+            self.transmit_packet = self._transmit_packet_debug
+        elif self.is_packet_mode:
+            self.transmit_packet = self._transmit_packet_with_length
+        else:
+            self.transmit_packet = self._write_port
 
     def transmit_packet(self, packet: bytes):
         """
-        Given a bytes object, write to serial.
+        Given a bytes object, write to serial (replaced by a specialized function, see _bind_transmit_packet()).
         Additionally, if in "packet mode" (from the API Reference Manual):
             "When using the BGAPI protocol without UART flow control over a simple 2-wire (TX and RX) UART interface
             and additional length byte needs to be added to the BGAPI packets, which tells the total length of the BGAPI
@@ -127,58 +252,113 @@ class BlueGigaProtocol:
         :return:
         """
 
-        # See comment above
+    def _transmit_packet_with_length(self, packet: bytes):
+        """
+        transmit_packet() in packet mode, without debug output.
+
+        :param packet: A bytes object.
+        :return:
+        """
+
+        self._write_port(bytes((len(packet) & 0xFF,)) + packet)
+
+    def _transmit_packet_debug(self, packet: bytes):
+        """
+        transmit_packet() in any mode, with debug output.
+
+        :param packet: A bytes object.
+        :return:
+        """
+
+        # See comment of transmit_packet()
         if self.is_packet_mode:
             packet = bytes([len(packet) & 0xFF]) + packet
-        if self.debug:
-            print('=>[ ' + ' '.join(['%02X' % b for b in packet]) + ' ]')
+        if __debug__ and self._debug:
+            print('=>[ ' + packet.hex(' ').upper() + ' ]')
+
+        self._write_port(packet)
+
+    def _write_port(self, packet: bytes):
+        """
+        Writes a packet straight to the file descriptor of the serial port, bypassing pyserial's write().
 
-        self.port.write(packet)
+        :param packet: A bytes object.
+        :return:
+        """
 
-    def read_packets(self, timeout: int = 1):
+        packet_view = memoryview(packet)
+        while len(packet_view) > 0:
+            try:
+                written = os.write(self.port.fd, packet_view)
+            except BlockingIOError:
+                # the port is non-blocking, wait until it is writable again
+                select.select([], [self.port.fd], [])
+                continue
+            packet_view = packet_view[written:]
+
+    def read_packets(self, timeout: float = 1):
         """
         Attempt to read bytes from communication port, with no intent of stopping early.
 
-        :param timeout: Time spent reading
+        :param timeout: Time spent reading (in seconds)
         :return: None
         """
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            self.busy_reading = True
-            time_spent        = time.time() - start_time
-            time_left         = int(timeout - time_spent)
+        deadline = time.monotonic() + timeout
+        while True:
+            time_left = deadline - time.monotonic()
+            if time_left <= 0:
+                break
 
-            if time_left > 0:
-                self.read_bytes(time_left)
+            self.busy_reading = True
+            self.read_bytes(time_left)
 
-    def read_packets_conditional(self, evt: EventType, timeout: int = 2):
+    def read_packets_conditional(self, evt: EventType, timeout: float = 2):
         """
         Attempt to read bytes from communication port, prematurely stopping on occurence of an event.
 
         :param evt: An event of interest (all events are defined at the start of BlueGigaProtocol)
-        :param timeout: Time spent reading
+        :param timeout: Time spent reading (in seconds)
         :return: Boolean, True => the event occurred
         """
 
         # Check if event has already occured
         if self.get_event_count(evt) > 0:
-            self.__eventcounter__[evt] = 0
+            self._evt_counts[evt] = 0
             return True
 
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            self.busy_reading   = True
-            time_spent          = time.time() - start_time
-            time_left           = int(timeout - time_spent)
+        deadline = time.monotonic() + timeout
+        while True:
+            time_left = deadline - time.monotonic()
+            if time_left <= 0:
+                break
 
-            if time_left > 0:
-                self.read_bytes(time_left)
+            self.busy_reading = True
+            self.read_bytes(time_left)
 
             if self.get_event_count(evt) > 0:
-                self.__eventcounter__[evt] = 0
+                self._evt_counts[evt] = 0
                 return True
         return False
 
+    def build_attribute_dispatch(self):
+        """
+        Maps the discovered IMU, EMG and battery attribute handles to their value handlers,
+        so that attribute value events are dispatched with a single dictionary lookup.
+
+        :return:
+        """
+
+        dispatch = {
+            self.imu_handler:     receive_imu_value,
+            self.emg_handler_0:   receive_emg_value,
+            self.emg_handler_1:   receive_emg_value,
+            self.emg_handler_2:   receive_emg_value,
+            self.emg_handler_3:   receive_emg_value,
+            self.battery_handler: receive_battery_value,
+        }
+        dispatch.pop(None, None)
+        self.attribute_dispatch = dispatch
+
     def get_event_count(self, evt: EventType):
         """
         Returns the current event count of event, incremented by event handlers.
@@ -187,24 +367,33 @@ class BlueGigaProtocol:
         :return: A count
         """
 
-        if hasattr(self, '__eventcounter__'):
-            if evt in self.__eventcounter__:
-                return self.__eventcounter__[evt]
-        return 0
+        return self._evt_counts.get(evt, 0)
 
-    def read_bytes(self, timeout: int):
+    def read_bytes(self, timeout: float):
         """
-        Attempts to read bytes from the communication port, and calls parse_byte() for processing.
+        Attempts to read all pending bytes from the communication port, and calls parse_ring() for processing.
 
-        :param timeout: Time spent reading
+        :param timeout: Time spent reading (in seconds)
         :return: Boolean, True => a byte was read, and it is not the last byte of a packet
         """
-        self.port.timeout = timeout
+        deadline = time.monotonic() + timeout
 
         while True:
-            byte_read = self.port.read(size=1)
-            if len(byte_read) > 0:
-                self.parse_byte(byte_read[0])
+            bytes_waiting = self.port.in_waiting
+            if bytes_waiting == 0:
+                # sleep in the kernel until bytes arrive or the deadline passes
+                time_left = deadline - time.monotonic()
+                if (time_left > 0) and select.select([self.port.fd], [], [], time_left)[0]:
+                    bytes_waiting = max(1, self.port.in_waiting)
+
+            if bytes_waiting > 0:
+                # read every pending byte in one call, straight into the ring buffer
+                if self.ring_tail == self.RING_BUFFER_SIZE:
+                    self.compact_ring()
+                ring_tail = self.ring_tail
+                count     = min(bytes_waiting, self.RING_BUFFER_SIZE - ring_tail)
+                self.ring_tail += os.readv(self.port.fd, [self.ring_view[ring_tail:ring_tail + count]])
+                self.parse_ring()
             else:
                 # timeout
                 self.busy_reading = False
@@ -216,7 +405,85 @@ class BlueGigaProtocol:
 
         return self.busy_reading
 
-    def parse_byte(self, byte_read: int):
+    def _read_serial(self):
+        """
+        Reader thread, only moves the bytes from the serial port to read_queue until close() is called.
+
+        :return: None
+        """
+
+        wakeup = self.reader_wakeup[0]
+        try:
+            while self.reader_running:
+                if wakeup in select.select([self.port.fd, wakeup], [], [])[0]:
+                    # woken up by close()
+                    break
+                chunk = os.read(self.port.fd, max(1, self.port.in_waiting))
+                if len(chunk) == 0:
+                    break
+                self.read_queue.put(chunk)
+        except (OSError, ValueError, TypeError):
+            # port closed
+            pass
+
+    def discard_pending(self):
+        """
+        Drops the bytes read but not parsed yet: the chunks queued by the reader thread, and a partial packet.
+
+        :return: None
+        """
+
+        if self.use_reader_thread:
+            try:
+                while True:
+                    self.read_queue.get_nowait()
+            except queue.Empty:
+                pass
+        self.ring_head = 0
+        self.ring_tail = 0
+
+    def close(self):
+        """
+        Stops and joins the reader thread (if any), then closes the serial port.
+
+        :return: None
+        """
+
+        if self.use_reader_thread and self.reader_running:
+            self.reader_running = False
+            os.write(self.reader_wakeup[1], b'\0')
+            # a reader blocked on a full queue is released by making room
+            self.discard_pending()
+            self.reader_thread.join()
+            os.close(self.reader_wakeup[0])
+            os.close(self.reader_wakeup[1])
+        self.port.close()
+
+    def _read_bytes_queued(self, timeout: float):
+        """
+        read_bytes() when a reader thread fills read_queue, calls feed() for processing.
+
+        :param timeout: Time spent reading (in seconds)
+        :return: Boolean, True => a byte was read, and it is not the last byte of a packet
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                chunk = self.read_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                # timeout
+                self.busy_reading = False
+                break
+
+            self.feed(chunk)
+            if not self.busy_reading:
+                # last byte of packet read
+                break
+
+        return self.busy_reading
+
+    def feed(self, buf: bytes):
         """
         Keeps track of bytes read. Upon completion of reading bytes from a packet, trigger an appropirate event.
 
@@ -246,144 +513,219 @@ class BlueGigaProtocol:
             |      |       | Bytes  |                       |                              |
             --------------------------------------------------------------------------------
 
-        :param byte_read: A byte read via read_bytes().
+        :param buf: Bytes read via read_bytes().
+        :return: None
+        """
+
+        buf_view = memoryview(buf)
+        while len(buf_view) > 0:
+            if self.ring_tail == self.RING_BUFFER_SIZE:
+                self.compact_ring()
+            count = min(self.RING_BUFFER_SIZE - self.ring_tail, len(buf_view))
+            self.ring_view[self.ring_tail:self.ring_tail + count] = buf_view[:count]
+            self.ring_tail += count
+            buf_view        = buf_view[count:]
+            self.parse_ring()
+
+    def compact_ring(self):
+        """
+        Moves the unparsed bytes to the start of the ring buffer, so that packets always stay contiguous.
+
+        :return: None
+        """
+
+        pending = self.ring_tail - self.ring_head
+        self.ring_buffer[:pending] = self.ring_buffer[self.ring_head:self.ring_tail]
+        self.ring_head = 0
+        self.ring_tail = pending
+
+    def parse_ring(self):
+        """
+        Fires the events of every complete packet in the ring buffer.
+        The packets are passed as memoryviews of the ring buffer, only valid until the next bytes are read.
+
         :return: None
         """
 
-        if (len(self.read_buffer) == 0) and (byte_read in [BluetoothMessages.bluetooth_resp,
-                                                           BluetoothMessages.bluetooth_event,
-                                                           WifiMessages.wifi_resp,
-                                                           WifiMessages.wifi_event]):
-            # if valid Message/Technology Types
-            self.read_buffer += bytes([byte_read])
-        elif len(self.read_buffer) == 1:
-            self.read_buffer           += bytes([byte_read])
-            self.expected_packet_length = PackageMessages.packet_header_length + (self.read_buffer[0] & PackageMessages.packet_length_high_bits) + self.read_buffer[1]  # Payload length (low bits)
-        elif len(self.read_buffer) > 1:
-            self.read_buffer += bytes([byte_read])
+        ring_buffer = self.ring_buffer
+        ring_head   = self.ring_head
+        ring_tail   = self.ring_tail
+        while ring_head < ring_tail:
+            if ring_buffer[ring_head] not in self.valid_message_types:
+                # skip bytes until a valid Message/Technology Types
+                ring_head += 1
+                continue
+            if ring_tail - ring_head < 2:
+                break
+            packet_length = _HEADER_LENGTH + (_S_LENGTH.unpack_from(ring_buffer, ring_head)[0] & _PAYLOAD_LENGTH_MASK)
+            if ring_tail - ring_head < packet_length:
+                break
 
-        if (self.expected_packet_length > 0) and (len(self.read_buffer) == self.expected_packet_length):
             # read last byte of a packet, fire appropriate events
-            if self.debug:
-                print('<=[ ' + ' '.join(['%02X' % b for b in self.read_buffer]) + ' ]')
-
-            packet_type, _, class_id, command_id = self.read_buffer[:PackageMessages.packet_header_length]
-            packet_payload = self.read_buffer[PackageMessages.packet_header_length:]
-
-            # note: Part of this byte (and next byte "_") contains bits for payload length
-            packet_type = packet_type & PackageMessages.packet_type_bits
-
-            # reset for next packet
-            self.read_buffer = bytes([])
-
-            if packet_type == BluetoothMessages.bluetooth_resp:
-                # (1) Bluetooth response packets
-                if class_id == BGAPIClasses.Connection:
-                    # Connection packets
-                    if command_id == ConnectionResponseCommands.ble_rsp_connection_disconnect:
-                        connection, result = struct.unpack('<BH', packet_payload[:3])
-                        if result != BleResponseConditions.disconnect_procedure_started:
-                            if self.debug:
-                                print(f"Failed to start disconnect procedure for connection {connection}.")
-                        else:
-                            self.disconnecting = True
-                            if self.debug:
-                                print(f"Started disconnect procedure for connection {connection}.")
-                        self.ble_rsp_connection_disconnect(**dict(connection=connection, result=result))
-                elif class_id == BGAPIClasses.GATT:
-                    # GATT packets - discover services, acquire data
-                    if command_id == GATTResponseCommands.ble_rsp_gatt_read_by_group_type:
-                        connection, result = struct.unpack('<BH', packet_payload[:3])
-                        self.ble_rsp_gatt_read_by_group_type(**dict(connection=connection, result=result))
-                    elif command_id == GATTResponseCommands.ble_rsp_gatt_find_information:
-                        connection, result = struct.unpack('<BH', packet_payload[:3])
-                        if result != BleResponseConditions.find_info_success:
-                            if self.debug:
-                                print("Error using find information command.")
-                        self.ble_rsp_gatt_find_information(**dict(connection=connection, result=result))
-                    elif command_id == GATTResponseCommands.ble_rsp_gatt_attribute_write:
-                        connection, result = struct.unpack('<BH', packet_payload[:3])
-                        if result != BleResponseConditions.write_success:
-                            raise "Write attempt was unsuccessful."
-                        self.ble_rsp_gatt_attribute_write(**dict(connection=connection, result=result))
-                elif class_id == BGAPIClasses.GAP:
-                    # GAP packets - advertise, observe, connect
-                    if command_id == GAPResponseCommands.ble_rsp_gap_set_mode:
-                        result = struct.unpack('<H', packet_payload[:2])[0]
-                        if result != BleResponseConditions.gap_set_mode_success:
-                            raise RuntimeError("Failed to set GAP mode.")
-                        else:
-                            if self.debug:
-                                print("Successfully set GAP mode.")
-                        self.ble_rsp_gap_set_mode(**dict(result=result))
-                    elif command_id == GAPResponseCommands.ble_rsp_gap_discover:
-                        result = struct.unpack('<H', packet_payload[:2])[0]
-                        if result != BleResponseConditions.gap_start_procedure_success:
-                            raise RuntimeError("Failed to start GAP discover procedure.")
-                        self.ble_rsp_gap_discover(**dict(result=result))
-                    elif command_id == GAPResponseCommands.ble_rsp_gap_connect_direct:
-                        result, connection_handle = struct.unpack('<HB', packet_payload[:3])
-                        if result != BleResponseConditions.gap_start_procedure_success:
-                            raise RuntimeError("Failed to start GAP connection procedure.")
-                        self.ble_rsp_gap_connect_direct(**dict(result=result, connection_handle=connection_handle))
-                    elif command_id == GAPResponseCommands.ble_rsp_gap_end_procedure:
-                        result = struct.unpack('<H', packet_payload[:2])[0]
-                        if result != BleResponseConditions.gap_end_procedure_success:
-                            if self.debug:
-                                print("Failed to end GAP procedure.")
-                        self.ble_rsp_gap_end_procedure(**dict(result=result))
-            elif packet_type == BluetoothMessages.bluetooth_event:
-                # (2) Bluetooth event packets
-                if class_id == BGAPIClasses.Connection:
-                    # connection packets
-                    if command_id == ConnectionEventCommands.ble_evt_connection_status:
-                        connection, flags, address, address_type, conn_interval, timeout, latency, bonding = struct.unpack('<BB6sBHHHB', packet_payload[:16])
-                        args = dict(connection=connection, flags=flags, address=address, address_type=address_type, conn_interval=conn_interval, timeout=timeout, latency=latency, bonding=bonding)
-                        print(f"Connected to a device with the following parameters:\n{args}")
-                        self.ble_evt_connection_status(**args)
-                    elif command_id == ConnectionEventCommands.ble_evt_connection_disconnected:
-                        connection, reason = struct.unpack('<BH', packet_payload[:3])
-                        if (self.connection is None) or (connection == self.connection['connection']):
-                            self.ble_evt_connection_disconnected(**dict(connection=connection, reason=reason))
-                elif class_id == BGAPIClasses.GATT:
-                    # GATT packets - discover services, acquire data
-                    if command_id == GATTEventCommands.ble_evt_gatt_procedure_completed:
-                        connection, result, chr_handler = struct.unpack('<BHH', packet_payload[:5])
-                        if (self.connection is not None) and (connection == self.connection['connection']):
-                            self.ble_evt_gatt_procedure_completed(**dict(connection=connection, result=result, chr_handler=chr_handler))
-                    elif command_id == GATTEventCommands.ble_evt_gatt_group_found:
-                        connection, start, end, uuid_len = struct.unpack('<BHHB', packet_payload[:6])
-                        if (self.connection is not None) and (connection == self.connection['connection']):
-                            uuid_data = packet_payload[6:]
-                            self.ble_evt_gatt_group_found(**dict(connection=connection, start=start, end=end, uuid=uuid_data))
-                    elif command_id == GATTEventCommands.ble_evt_gatt_find_information_found:
-                        connection, chr_handler, uuid_len = struct.unpack('<BHB', packet_payload[:4])
-                        uuid_data = packet_payload[4:]
-                        if (self.connection is not None) and (connection == self.connection['connection']):
-                            self.ble_evt_gatt_find_information_found(**dict(connection=connection, chr_handler=chr_handler, uuid=uuid_data))
-                    elif command_id == GATTEventCommands.ble_evt_gatt_attribute_value:
-                        connection, att_handler, att_type, value_len = struct.unpack('<BHBB', packet_payload[:5])
-                        if (self.connection is not None) and (connection == self.connection['connection']):
-                            value_data = packet_payload[5:]
-                            self.ble_evt_gatt_attribute_value(**dict(connection=connection, att_handler=att_handler, att_type=att_type, att_value=value_data))
-                elif class_id == BGAPIClasses.GAP:
-                    # GAP packets - advertise, observe, connect
-                    if command_id == GAPEventCommands.ble_evt_gap_scan_response:
-                        rssi, packet_type, address, address_type, bond, data_len = struct.unpack('<bB6sBBB', packet_payload[:11])
-                        data = packet_payload[11:]
-                        self.ble_evt_gap_scan_response(**dict(rssi=rssi, packet_type=packet_type, address=address, address_type=address_type, bond=bond, data=data))
-                    elif command_id == GAPEventCommands.ble_evt_gap_mode_changed:
-                        # discover, connect = struct.unpack('<BB', packet_payload[:2])
-                        # self.ble_evt_gap_mode_changed({ 'discover': discover, 'connect': connect })
-                        pass
-            elif packet_type == WifiMessages.wifi_resp:
-                # (3) Wifi response packet
-                pass
-            else:
-                # (4) Wifi event packet
-                pass
-            # reset
-            self.busy_reading = False
+            self.ring_head = ring_head + packet_length
+            self.parse_packet(self.ring_view[ring_head:ring_head + packet_length])
+            ring_head += packet_length
+
+        if ring_head == ring_tail:
+            # nothing pending, restart from the beginning of the ring buffer
+            self.ring_head = self.ring_tail = 0
+        else:
+            self.ring_head = ring_head
+
+    def parse_packet(self, packet: memoryview):
+        """
+        Fires the events of a complete BGAPI packet.
+
+        :param packet: A complete packet, header included.
+        :return: None
+        """
+
+        if __debug__ and self._debug:
+            print('<=[ ' + packet.hex(' ').upper() + ' ]')
+
+        packet_type, _, class_id, command_id = _S_HEADER.unpack_from(packet)
+        packet_payload = packet[_HEADER_LENGTH:]
+
+        # note: Part of this byte (and next byte "_") contains bits for payload length
+        packet_type = packet_type & _PACKET_TYPE_BITS
+
+        # Wifi packets and unknown Bluetooth packets are ignored
+        packet_handler = self.packet_handlers.get((packet_type, class_id, command_id))
+        if packet_handler is not None:
+            packet_handler(self, packet_payload)
+
+        # reset
+        self.busy_reading = False
+
+    @staticmethod
+    def _fail_write():
+        raise RuntimeError("Write attempt was unsuccessful.")
+
+    @staticmethod
+    def _log_connected(args: dict):
+        print(f"Connected to a device with the following parameters:\n{args}")
+
+    # (1) Bluetooth response packets
+
+    def parse_rsp_connection_disconnect(self, packet_payload: memoryview):
+        connection, result = _S_BH.unpack_from(packet_payload)
+        if result != BleResponseConditions.disconnect_procedure_started:
+            if __debug__ and self._debug:
+                print(f"Failed to start disconnect procedure for connection {connection}.")
+        else:
+            self.disconnecting = True
+            if __debug__ and self._debug:
+                print(f"Started disconnect procedure for connection {connection}.")
+        self.ble_rsp_connection_disconnect(connection=connection, result=result)
+
+    def parse_rsp_gatt_read_by_group_type(self, packet_payload: memoryview):
+        connection, result = _S_BH.unpack_from(packet_payload)
+        self.ble_rsp_gatt_read_by_group_type(connection=connection, result=result)
+
+    def parse_rsp_gatt_find_information(self, packet_payload: memoryview):
+        connection, result = _S_BH.unpack_from(packet_payload)
+        if result != BleResponseConditions.find_info_success:
+            if __debug__ and self._debug:
+                print("Error using find information command.")
+        self.ble_rsp_gatt_find_information(connection=connection, result=result)
+
+    def parse_rsp_gatt_attribute_write(self, packet_payload: memoryview):
+        connection, result = _S_BH.unpack_from(packet_payload)
+        if result != BleResponseConditions.write_success:
+            self._fail_write()
+        self.ble_rsp_gatt_attribute_write(connection=connection, result=result)
+
+    def parse_rsp_gap_set_mode(self, packet_payload: memoryview):
+        result = _S_H.unpack_from(packet_payload)[0]
+        if result != BleResponseConditions.gap_set_mode_success:
+            raise RuntimeError("Failed to set GAP mode.")
+        else:
+            if __debug__ and self._debug:
+                print("Successfully set GAP mode.")
+        self.ble_rsp_gap_set_mode(result=result)
+
+    def parse_rsp_gap_discover(self, packet_payload: memoryview):
+        result = _S_H.unpack_from(packet_payload)[0]
+        if result != BleResponseConditions.gap_start_procedure_success:
+            raise RuntimeError("Failed to start GAP discover procedure.")
+        self.ble_rsp_gap_discover(result=result)
+
+    def parse_rsp_gap_connect_direct(self, packet_payload: memoryview):
+        result, connection_handle = _S_HB.unpack_from(packet_payload)
+        if result != BleResponseConditions.gap_start_procedure_success:
+            raise RuntimeError("Failed to start GAP connection procedure.")
+        self.ble_rsp_gap_connect_direct(result=result, connection_handle=connection_handle)
+
+    def parse_rsp_gap_end_procedure(self, packet_payload: memoryview):
+        result = _S_H.unpack_from(packet_payload)[0]
+        if result != BleResponseConditions.gap_end_procedure_success:
+            if __debug__ and self._debug:
+                print("Failed to end GAP procedure.")
+        self.ble_rsp_gap_end_procedure(result=result)
+
+    # (2) Bluetooth event packets
+
+    def parse_evt_connection_status(self, packet_payload: memoryview):
+        connection, flags, address, address_type, conn_interval, timeout, latency, bonding = _S_CONNECTION_STATUS.unpack_from(packet_payload)
+        args = dict(connection=connection, flags=flags, address=address, address_type=address_type, conn_interval=conn_interval, timeout=timeout, latency=latency, bonding=bonding)
+        self._log_connected(args)
+        self.ble_evt_connection_status(**args)
+
+    def parse_evt_connection_disconnected(self, packet_payload: memoryview):
+        connection, reason = _S_BH.unpack_from(packet_payload)
+        if (self.connection is None) or (connection == self.connection.connection):
+            self.ble_evt_connection_disconnected(connection=connection, reason=reason)
+
+    def parse_evt_gatt_procedure_completed(self, packet_payload: memoryview):
+        connection, result, chr_handler = _S_BHH.unpack_from(packet_payload)
+        if (self.connection is not None) and (connection == self.connection.connection):
+            self.ble_evt_gatt_procedure_completed(connection=connection, result=result, chr_handler=chr_handler)
+
+    def parse_evt_gatt_group_found(self, packet_payload: memoryview):
+        connection, start, end, uuid_len = _S_BHHB.unpack_from(packet_payload)
+        if (self.connection is not None) and (connection == self.connection.connection):
+            uuid_data = bytes(packet_payload[6:])
+            self.ble_evt_gatt_group_found(connection=connection, start=start, end=end, uuid=uuid_data)
+
+    def parse_evt_gatt_find_information_found(self, packet_payload: memoryview):
+        connection, chr_handler, uuid_len = _S_BHB.unpack_from(packet_payload)
+        uuid_data = bytes(packet_payload[4:])
+        if (self.connection is not None) and (connection == self.connection.connection):
+            self.ble_evt_gatt_find_information_found(connection=connection, chr_handler=chr_handler, uuid=uuid_data)
+
+    def parse_evt_gatt_attribute_value(self, packet_payload: memoryview):
+        connection, att_handler, att_type, value_len = _S_BHBB.unpack_from(packet_payload)
+        if att_handler not in self.attribute_dispatch:
+            # no handler for this attribute (e.g. the stream was not enabled), nothing to fire
+            return
+        if (self.connection is not None) and (connection == self.connection.connection):
+            value_data = packet_payload[5:]
+            self.ble_evt_gatt_attribute_value(connection, att_handler, att_type, value_data)
+
+    def parse_evt_gap_scan_response(self, packet_payload: memoryview):
+        rssi, packet_type, address, address_type, bond, data_len = _S_SCAN_RESPONSE.unpack_from(packet_payload)
+        data = bytes(packet_payload[11:])
+        self.ble_evt_gap_scan_response(rssi=rssi, packet_type=packet_type, address=address, address_type=address_type, bond=bond, data=data)
+
+    # (packet type, class id, command id) -> packet parser, looked up once per packet
+    # note: ble_evt_gap_mode_changed (discover, connect = '<BB') is not used
+    packet_handlers = {
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.Connection, ConnectionResponseCommands.ble_rsp_connection_disconnect):   parse_rsp_connection_disconnect,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GATT, GATTResponseCommands.ble_rsp_gatt_read_by_group_type):             parse_rsp_gatt_read_by_group_type,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GATT, GATTResponseCommands.ble_rsp_gatt_find_information):               parse_rsp_gatt_find_information,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GATT, GATTResponseCommands.ble_rsp_gatt_attribute_write):                parse_rsp_gatt_attribute_write,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GAP, GAPResponseCommands.ble_rsp_gap_set_mode):                          parse_rsp_gap_set_mode,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GAP, GAPResponseCommands.ble_rsp_gap_discover):                          parse_rsp_gap_discover,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GAP, GAPResponseCommands.ble_rsp_gap_connect_direct):                    parse_rsp_gap_connect_direct,
+        (BluetoothMessages.bluetooth_resp, BGAPIClasses.GAP, GAPResponseCommands.ble_rsp_gap_end_procedure):                     parse_rsp_gap_end_procedure,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.Connection, ConnectionEventCommands.ble_evt_connection_status):         parse_evt_connection_status,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.Connection, ConnectionEventCommands.ble_evt_connection_disconnected):   parse_evt_connection_disconnected,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.GATT, GATTEventCommands.ble_evt_gatt_procedure_completed):              parse_evt_gatt_procedure_completed,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.GATT, GATTEventCommands.ble_evt_gatt_group_found):                      parse_evt_gatt_group_found,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.GATT, GATTEventCommands.ble_evt_gatt_find_information_found):           parse_evt_gatt_find_information_found,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.GATT, GATTEventCommands.ble_evt_gatt_attribute_value):                  parse_evt_gatt_attribute_value,
+        (BluetoothMessages.bluetooth_event, BGAPIClasses.GAP, GAPEventCommands.ble_evt_gap_scan_response):                       parse_evt_gap_scan_response,
+    }
 
     def ble_cmd_connection_disconnect(self, connection: bytes):
         """
@@ -398,7 +740,7 @@ class BlueGigaProtocol:
         payload_length  = 1
         packet_class    = BGAPIClasses.Connection
         message_id      = GATTTransmitCommands.ble_tmt_connection_disconnect
-        return struct.pack('<4BB', CommandMessages.command_message, payload_length, packet_class, message_id, connection)
+        return _S_CMD_B.pack(CommandMessages.command_message, payload_length, packet_class, message_id, connection)
 
     def ble_cmd_attclient_read_by_group_type(self, connection: int, start: bytes, end: bytes, uuid: bytes):
         """
@@ -417,7 +759,7 @@ class BlueGigaProtocol:
         payload_length  = 6 + len(uuid)
         packet_class    = BGAPIClasses.GATT
         message_id      = GATTTransmitCommands.ble_tmt_attclient_read_by_group_type
-        return struct.pack('<4BBHHB' + str(len(uuid)) + 's', CommandMessages.command_message, payload_length, packet_class, message_id, connection, start, end, len(uuid), bytes(i for i in uuid))
+        return _s_cmd_read_by_group_type(len(uuid)).pack(CommandMessages.command_message, payload_length, packet_class, message_id, connection, start, end, len(uuid), uuid)
 
     def ble_cmd_attclient_find_information(self, connection: int, start: bytes, end: bytes):
         """
@@ -432,9 +774,9 @@ class BlueGigaProtocol:
         payload_length  = 5
         packet_class    = BGAPIClasses.GATT
         messaged_id     = GATTTransmitCommands.ble_tmt_attclient_find_information
-        return struct.pack('<4BBHH', CommandMessages.command_message, payload_length, packet_class, messaged_id, connection, start, end)
+        return _S_CMD_BHH.pack(CommandMessages.command_message, payload_length, packet_class, messaged_id, connection, start, end)
 
-    def ble_cmd_attclient_attribute_write(self, connection: int, att_handler: bytes, data: bytes):
+    def ble_cmd_attclient_attribute_write(self, connection: int, att_handler: int, data: bytes):
         """
         This command can be used to write an attributes value on a remote device. In order to write the value of an attribute a Bluetooth connection must exist.
         -> A successful attribute write will be acknowledged by the remote device and this will generate an event attclient_procedure_completed.
@@ -448,7 +790,7 @@ class BlueGigaProtocol:
         payload_length  = 4 + len(data)
         packet_class    = BGAPIClasses.GATT
         message_id      = GATTTransmitCommands.ble_tmt_attclient_attribute_write
-        return struct.pack('<4BBHB' + str(len(data)) + 's', CommandMessages.command_message, payload_length, packet_class, message_id, connection, att_handler, len(data), bytes(i for i in data))
+        return _s_cmd_attribute_write(len(data)).pack(CommandMessages.command_message, payload_length, packet_class, message_id, connection, att_handler, len(data), data)
 
     def ble_cmd_gap_set_mode(self, discover: int, connect: int):
         """
@@ -464,7 +806,7 @@ class BlueGigaProtocol:
         payload_length  = 2
         packet_class    = BGAPIClasses.GAP
         message_id      = GAPTransmitCommands.ble_tmt_gap_set_mode
-        return struct.pack('<4BBB', CommandMessages.command_message, payload_length, packet_class, message_id, discover, connect)
+        return _S_CMD_BB.pack(CommandMessages.command_message, payload_length, packet_class, message_id, discover, connect)
 
     def ble_cmd_gap_discover(self, mode: bytes):
         """
@@ -479,7 +821,7 @@ class BlueGigaProtocol:
         payload_length  = 1
         packet_class    = BGAPIClasses.GAP
         message_id      = GAPTransmitCommands.ble_tmt_gap_discover
-        return struct.pack('<4BB', CommandMessages.command_message, payload_length, packet_class, message_id, mode)
+        return _S_CMD_B.pack(CommandMessages.command_message, payload_length, packet_class, message_id, mode)
 
     def ble_cmd_gap_connect_direct(self, address: bytes, addr_type: int, conn_interval_min: int, conn_interval_max: int, timeout: int, latency: int):
         """
@@ -506,7 +848,7 @@ class BlueGigaProtocol:
         payload_length  = 15
         packet_class    = BGAPIClasses.GAP
         message_id      = GAPTransmitCommands.ble_tmt_gap_connect_direct
-        return struct.pack('<4B6sBHHHH', CommandMessages.command_message, payload_length, packet_class, message_id, bytes(i for i in address), addr_type, conn_interval_min, conn_interval_max, timeout, latency)
+        return _S_CMD_CONNECT_DIRECT.pack(CommandMessages.command_message, payload_length, packet_class, message_id, address, addr_type, conn_interval_min, conn_interval_max, timeout, latency)
 
     def ble_cmd_gap_end_procedure(self):
         """
@@ -518,9 +860,9 @@ class BlueGigaProtocol:
         payload_length  = 0
         packet_class    = BGAPIClasses.GAP
         message_id      = GAPTransmitCommands.ble_tmt_gap_end_procedure
-        return struct.pack('<4B', CommandMessages.command_message, payload_length, packet_class, message_id)
+        return _S_CMD.pack(CommandMessages.command_message, payload_length, packet_class, message_id)
 
-    def ble_cmd_attclient_read_by_handle(self, connection: int, chr_handler: bytes):
+    def ble_cmd_attclient_read_by_handle(self, connection: int, chr_handler: int):
         """
         This command reads a remote attribute's value with the given handle. Read by handle can be used to read
         attributes up to 22 bytes long. For longer attributes Read Long command must be used.
@@ -533,4 +875,4 @@ class BlueGigaProtocol:
         payload_length  = 3
         packet_class    = BGAPIClasses.GATT
         message_id      = GATTTransmitCommands.ble_tmt_attclient_read_by_handle
-        return struct.pack('<4BBH', CommandMessages.command_message, payload_length, packet_class, message_id, connection, chr_handler)
+        return _S_CMD_BH.pack(CommandMessages.command_message, payload_length, packet_class, message_id, connection, chr_handler)
@@ -17,51 +17,124 @@ limitations under the License.
 # Reference:
 # https://github.com/sebastiankmiec/PythonMyoLinux/pymyolinux
 
+import logging
 import struct
+from typing import NamedTuple
+import numpy as np
 from utils import *
 
 __all__ = [
+    'MyoDevice',
+    'Connection',
+    'FoundService',
+    'FoundAttribute',
     'joint_event_handler',
     'receive_attribute_value',
+    'receive_imu_value',
+    'receive_emg_value',
+    'receive_battery_value',
     'add_myo_device',
     'add_connection',
     'disconnect_device',
     'add_found_service',
     'add_found_attribute',
-    'complete_finding_service',
-    'empty_handler'
+    'complete_finding_service'
 ]
 
+# precompiled payload format of the IMU attribute value
+_IMU_STRUCT = struct.Struct('<10h')
 
-def joint_event_handler(emg_list: list,
-                        orient_w: float, orient_x: float, orient_y: float, orient_z: float,
-                        accel_1: float, accel_2: float, accel_3: float,
-                        gyro_1: float, gyro_2: float, gyro_3: float, sample_num: int):
+# Accelerometer values are multiplied by 2048 (and are in units of g)
+_INV_ACCEL = 1.0 / 2048.0
+
+# Gyroscope values are multiplied by 16 (and are in units of deg/s)
+_INV_GYRO = 1.0 / 16.0
+
+# Orientation values are multiplied by 16384 (units of a unit quaternion)
+_INV_ORIENT = 1.0 / 16384.0
+
+# advertised by Myo devices, checked against every advertisement packet while scanning
+_CONTROL_UUID = get_full_uuid(HardwareServices.ControlService)
+
+# known disconnect reasons reported by disconnect_device()
+_DISCONNECT_REASONS = {
+    BleErrorCodes.connection_timeout:
+        "connection timeout (link supervision timeout has expired). Error Code 0x0208",
+    BleErrorCodes.connection_term_by_local_host:
+        "termination by local host (local device terminated the connection). Error Code 0x0216",
+}
 
-    # Accelerometer values are multiplied by the following constant (and are in units of g)
-    MYO_ACCELEROMETER_SCALE = 2048.0
+logger = logging.getLogger(__name__)
 
-    # Gyroscope values are multiplied by the following constant (and are in units of deg/s)
-    MYO_GYROSCOPE_SCALE = 16.0
 
-    # Orientation values are multiplied by the following constant (units of a unit quaternion)
-    MYO_ORIENTATION_SCALE = 16384.0
+class MyoDevice(NamedTuple):
+    """
+    Myo device found while scanning, filled by add_myo_device()
+    """
+
+    address: bytes
+    address_type: int
+    rssi: int
+
+
+class Connection(NamedTuple):
+    """
+    Connection to a Myo device, filled by add_connection()
+    """
 
-    print('-------------------------------------------------------------------------------------------')
-    print((emg_list[0], emg_list[1], emg_list[2], emg_list[3], emg_list[4], emg_list[5], emg_list[6], emg_list[7]))
-    print((orient_w / MYO_ORIENTATION_SCALE,
-           orient_x / MYO_ORIENTATION_SCALE,
-           orient_y / MYO_ORIENTATION_SCALE,
-           orient_z / MYO_ORIENTATION_SCALE,
-           accel_1 / MYO_ACCELEROMETER_SCALE,
-           accel_2 / MYO_ACCELEROMETER_SCALE,
-           accel_3 / MYO_ACCELEROMETER_SCALE,
-           gyro_1 / MYO_GYROSCOPE_SCALE,
-           gyro_2 / MYO_GYROSCOPE_SCALE,
-           gyro_3 / MYO_GYROSCOPE_SCALE))
+    connection: int
+    flags: int
+    address: bytes
+    address_type: int
+    conn_interval: int
+    timeout: int
+    latency: int
+    bonding: int
 
 
-def receive_attribute_value(sender_obj: EventType, connection: int, att_handler: bytes, att_type: int, att_value: bytes):
+class FoundService(NamedTuple):
+    """
+    GATT service group found on the connected device, filled by add_found_service()
+    """
+
+    start: int
+    end: int
+    uuid: bytes
+
+
+class FoundAttribute(NamedTuple):
+    """
+    GATT attribute found on the connected device, filled by add_found_attribute()
+    """
+
+    chr_handler: int
+    uuid: bytes
+
+
+def joint_event_handler(emg_list: memoryview,
+                        orient_w: float, orient_x: float, orient_y: float, orient_z: float,
+                        accel_1: float, accel_2: float, accel_3: float,
+                        gyro_1: float, gyro_2: float, gyro_3: float, sample_num: int):
+
+    # samples are only formatted when debug output is enabled, printing every packet stalls the receive loop
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    logger.debug('sample %d, EMG: %s, IMU: %s', sample_num,
+                 (emg_list[0], emg_list[1], emg_list[2], emg_list[3], emg_list[4], emg_list[5], emg_list[6], emg_list[7]),
+                 (orient_w * _INV_ORIENT,
+                  orient_x * _INV_ORIENT,
+                  orient_y * _INV_ORIENT,
+                  orient_z * _INV_ORIENT,
+                  accel_1 * _INV_ACCEL,
+                  accel_2 * _INV_ACCEL,
+                  accel_3 * _INV_ACCEL,
+                  gyro_1 * _INV_GYRO,
+                  gyro_2 * _INV_GYRO,
+                  gyro_3 * _INV_GYRO))
+
+
+def receive_attribute_value(sender_obj: EventType, connection: int, att_handler: int, att_type: int, att_value: bytes):
     """
     BLE response handlers for BlueGigaProtocol
 
@@ -72,56 +145,75 @@ def receive_attribute_value(sender_obj: EventType, connection: int, att_handler:
     :param att_value:
     :return:
     """
-    if att_handler == sender_obj.imu_handler:
-        # IMU
-        orient_w, orient_x, orient_y, orient_z, accel_1, accel_2, accel_3, gyro_1, gyro_2, gyro_3 = struct.unpack('<10h', att_value)
-
-        sender_obj.current_imu_read = dict(orient_w=orient_w, orient_x=orient_x, orient_y=orient_y, orient_z=orient_z,
-                                           accel_1=accel_1, accel_2=accel_2, accel_3=accel_3,
-                                           gyro_1=gyro_1, gyro_2=gyro_2, gyro_3=gyro_3)
-
-        # trigger IMU event
-        sender_obj.imu_event(orient_w=orient_w, orient_x=orient_x, orient_y=orient_y, orient_z=orient_z,
-                             accel_1=accel_1, accel_2=accel_2, accel_3=accel_3, gyro_1=gyro_1,
-                             gyro_2=gyro_2, gyro_3=gyro_3)
-    elif ((att_handler == sender_obj.emg_handler_0) or
-          (att_handler == sender_obj.emg_handler_1) or
-          (att_handler == sender_obj.emg_handler_2) or
-          (att_handler == sender_obj.emg_handler_3)):
-        # EMG
-        (sample_0_1, sample_0_2, sample_0_3, sample_0_4, sample_0_5, sample_0_6, sample_0_7, sample_0_8,
-         sample_1_1, sample_1_2, sample_1_3, sample_1_4, sample_1_5, sample_1_6, sample_1_7, sample_1_8) = struct.unpack('<16b', att_value)
-
-        # trigger two EMG events
-        sample_num = 1
-        sender_obj.emg_event(
-            emg_list=[sample_0_1, sample_0_2, sample_0_3, sample_0_4, sample_0_5, sample_0_6, sample_0_7, sample_0_8],
-            sample_num=sample_num
-        )
-
-        sample_num = 2
-        sender_obj.emg_event(
-            emg_list=[sample_1_1, sample_1_2, sample_1_3, sample_1_4, sample_1_5, sample_1_6, sample_1_7, sample_1_8],
-            sample_num=sample_num
-        )
-
-        # trigger two joint IMU/EMG events:
-        sample_num = 1
-        sender_obj.joint_emg_imu_event(
-            emg_list=[sample_0_1, sample_0_2, sample_0_3, sample_0_4, sample_0_5, sample_0_6, sample_0_7, sample_0_8],
-            **sender_obj.current_imu_read,
-            sample_num=sample_num
-        )
-
-        sample_num = 2
-        sender_obj.joint_emg_imu_event(
-            emg_list=[sample_1_1, sample_1_2, sample_1_3, sample_1_4, sample_1_5, sample_1_6, sample_1_7, sample_1_8],
-            **sender_obj.current_imu_read,
-            sample_num=sample_num
-        )
-    elif att_handler == sender_obj.battery_handler:
-        # Battery Level Attribute
-        sender_obj.battery_level = ord(att_value)
+    # the parser only fires this event for handles in attribute_dispatch
+    sender_obj.attribute_dispatch[att_handler](sender_obj, att_value)
+
+
+def receive_imu_value(sender_obj: EventType, att_value: bytes):
+    """
+    Handles a value of the IMU attribute (dispatched from receive_attribute_value)
+
+    :param sender_obj:
+    :param att_value:
+    :return:
+    """
+    imu_read = _IMU_STRUCT.unpack_from(att_value)
+
+    # kept as the unpacked tuple (orient_w, ..., gyro_3), passed on positionally with each joint EMG/IMU event
+    sender_obj.current_imu_read = imu_read
+
+    # trigger IMU event, positionally: (orient_w, orient_x, orient_y, orient_z, accel_1, ..., gyro_3)
+    sender_obj.imu_event(*imu_read)
+
+
+def receive_emg_value(sender_obj: EventType, att_value: bytes):
+    """
+    Handles a value of one of the four EMG attributes (dispatched from receive_attribute_value)
+
+    :param sender_obj:
+    :param att_value:
+    :return:
+    """
+    for ring in sender_obj.emg_rings:
+        ring.write_packet(att_value)
+
+    if sender_obj.emg_batch_size > 0:
+        # batched: collect the packet, fire one event per full batch instead of per-sample events
+        offset = 16 * sender_obj.emg_batch_count
+        sender_obj.emg_batch_buffer[offset:offset + 16] = att_value
+        sender_obj.emg_batch_count += 1
+        if sender_obj.emg_batch_count == sender_obj.emg_batch_size:
+            sender_obj.emg_batch_count = 0
+            # one contiguous row of samples per channel, shape (8, 2 * batch size)
+            emg_batch = np.frombuffer(sender_obj.emg_batch_buffer, dtype=np.int8).reshape(-1, 8).T.copy()
+            sender_obj.emg_batch_event(emg_batch)
+        return
+
+    # copy out of the receive buffer into the next preallocated slot, whose two 8-sample views are handed out
+    slot = sender_obj.emg_slot_index
+    sender_obj.emg_slots[16 * slot:16 * slot + 16] = att_value
+    sender_obj.emg_slot_index = (slot + 1) % sender_obj.EMG_SLOT_COUNT
+    emg_list_0, emg_list_1 = sender_obj.emg_slot_views[slot]
+
+    # trigger two EMG events, positionally: (emg_list, sample_num)
+    sender_obj.emg_event(emg_list_0, 1)
+    sender_obj.emg_event(emg_list_1, 2)
+
+    # trigger two joint IMU/EMG events, positionally: (emg_list, orient_w, ..., gyro_3, sample_num)
+    imu_read = sender_obj.current_imu_read
+    sender_obj.joint_emg_imu_event(emg_list_0, *imu_read, 1)
+    sender_obj.joint_emg_imu_event(emg_list_1, *imu_read, 2)
+
+
+def receive_battery_value(sender_obj: EventType, att_value: bytes):
+    """
+    Handles a value of the battery level attribute (dispatched from receive_attribute_value)
+
+    :param sender_obj:
+    :param att_value:
+    :return:
+    """
+    sender_obj.battery_level = att_value[0]
 
 
 def add_myo_device(sender_obj: EventType, rssi: int, packet_type: int, address: bytes, address_type: int, bond: int, data: bytes):
@@ -139,17 +231,12 @@ def add_myo_device(sender_obj: EventType, rssi: int, packet_type: int, address:
     """
 
     # check if it is a Myo advertising control service packet
-    control_uuid = get_full_uuid(HardwareServices.ControlService)
-    if data.endswith(control_uuid):
-        myo_connection = dict(address=address, address_type=address_type, rssi=rssi)
-        unique = True
-        for device in sender_obj.myo_devices:
-            # note, device also has "rssi"
-            if (myo_connection['address'] == device['address']) and (myo_connection['address_type'] == device['address_type']):
-                unique = False
-                break
-        if unique:
-            sender_obj.myo_devices.append(myo_connection)
+    if data.endswith(_CONTROL_UUID):
+        # a device is identified by its address and address type (note, device also has "rssi")
+        device_key = (address, address_type)
+        if device_key not in sender_obj.myo_device_keys:
+            sender_obj.myo_device_keys.add(device_key)
+            sender_obj.myo_devices.append(MyoDevice(address, address_type, rssi))
 
 
 def add_connection(sender_obj: EventType, connection: int, flags: int, address: bytes, address_type: int, conn_interval: int, timeout: int, latency: int, bonding: int):
@@ -168,17 +255,10 @@ def add_connection(sender_obj: EventType, connection: int, flags: int, address:
     :return:
     """
 
-    sender_obj.connection = dict(connection=connection,
-                                 flags=flags,
-                                 address=address,
-                                 address_type=address_type,
-                                 conn_interval=conn_interval,
-                                 timeout=timeout,
-                                 latency=latency,
-                                 bonding=bonding)
+    sender_obj.connection = Connection(connection, flags, address, address_type, conn_interval, timeout, latency, bonding)
 
 
-def disconnect_device(sender_obj: EventType, connection: int, reason: bytes):
+def disconnect_device(sender_obj: EventType, connection: int, reason: int):
     """
     Disconnect found Myo device for some reason
 
@@ -188,12 +268,8 @@ def disconnect_device(sender_obj: EventType, connection: int, reason: bytes):
     :return:
     """
 
-    if reason == BleErrorCodes.connection_timeout:
-        print(f"Connection \"{connection}\" disconnected due to connection timeout (link supervision timeout has expired). Error Code 0x0208")
-    elif reason == BleErrorCodes.connection_term_by_local_host:
-        print(f"Connection \"{connection}\" disconnected due to termination by local host (local device terminated the connection). Error Code 0x0216")
-    else:
-        print(f"Connection \"{connection}\" disconnected due to unknown reason (reason = {reason}).")
+    reason_msg = _DISCONNECT_REASONS.get(reason, f"unknown reason (reason = {reason}).")
+    print(f"Connection \"{connection}\" disconnected due to {reason_msg}")
 
     sender_obj.disconnecting = False
     sender_obj.connection = None
@@ -213,10 +289,10 @@ def add_found_service(sender_obj: EventType, connection: int, start: bytes, end:
     :return:
     """
 
-    sender_obj.found_services.append(dict(start=start, end=end, uuid=uuid))
+    sender_obj.found_services.append(FoundService(start, end, uuid))
 
 
-def add_found_attribute(sender_obj: EventType, connection: int, chr_handler: bytes, uuid: bytes):
+def add_found_attribute(sender_obj: EventType, connection: int, chr_handler: int, uuid: bytes):
     """
     Add the found attribute
 
@@ -227,10 +303,10 @@ def add_found_attribute(sender_obj: EventType, connection: int, chr_handler: byt
     :return:
     """
 
-    sender_obj.found_attributes.append(dict(chr_handler=chr_handler, uuid=uuid))
+    sender_obj.found_attributes.append(FoundAttribute(chr_handler, uuid))
 
 
-def complete_finding_service(sender_obj: EventType, connection: int, result: bytes, chr_handler: bytes):
+def complete_finding_service(sender_obj: EventType, connection: int, result: bytes, chr_handler: int):
     """
     Complete finding service
 
@@ -243,7 +319,3 @@ def complete_finding_service(sender_obj: EventType, connection: int, result: byt
 
     if result != BleResponseConditions.gap_end_procedure_success:
         raise RuntimeError(f"Attribute protocol error code returned by remote device (result = {result}).")
-
-
-def empty_handler(sender_obj, **kwargs):
-    pass
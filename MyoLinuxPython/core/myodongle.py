@@ -20,9 +20,25 @@ limitations under the License.
 import struct
 from core.bluegiga import BlueGigaProtocol
 from utils.packet_def import *
+from utils.shared_ring import EmgSharedRing
 
 __all__ = ['MyoDongle']
 
+# precompiled payload formats of the set mode and set sleep mode commands
+_MODE_CMD  = struct.Struct('<5B')
+_SLEEP_CMD = struct.Struct('<3B')
+
+# UUIDs of the attributes used by fill_handlers(), mapped to their role
+_ATTRIBUTE_ROLES = {
+    get_full_uuid(HardwareServices.IMUDataCharacteristic):  'imu',
+    get_full_uuid(HardwareServices.CommandCharacteristic):  'command',
+    get_full_uuid(HardwareServices.EmgData0Characteristic): 'emg_0',
+    get_full_uuid(HardwareServices.EmgData1Characteristic): 'emg_1',
+    get_full_uuid(HardwareServices.EmgData2Characteristic): 'emg_2',
+    get_full_uuid(HardwareServices.EmgData3Characteristic): 'emg_3',
+    HardwareServices.BatteryLevelCharacteristic:            'battery',
+}
+
 
 class MyoDongle:
     """
@@ -52,6 +68,8 @@ class MyoDongle:
 
         # filled via "discover_primary_services()"
         self.handlers        = {}
+        self.emg_descriptors = ()   # CCCD handles of the four EMG characteristics
+        self._handlers_ready = False
         self.imu_enabled    = False
         self.emg_enabled    = False
         self.sleep_disabled = False
@@ -63,63 +81,25 @@ class MyoDongle:
         :param timeout: Time to wait for responses
         """
 
+        # bytes read before the reset (e.g. queued by the reader thread) would otherwise be parsed later
+        self.ble.discard_pending()
+
         if not (self.ble.connection is None):
             # disable IMU readings
             if self.imu_enabled:
                 # unsubscribe
-                self.transmit_wait(
-                    self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['imu_descriptor'], NotificationCommands.disable_notifications),
-                    BlueGigaProtocol.ble_rsp_gatt_attribute_write
-                )
-
-                resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-                if not resp_received:
-                    raise RuntimeError("GATT procedure (write completion to CCCD) response timed out.")
+                self.write_packet_wait(self._pkt_imu_disable, "write completion to CCCD")
 
             # Disable EMG readings
             if self.emg_enabled:
-                for emg_num in range(4):
-                    self.transmit_wait(
-                        self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['emg_descriptor_' + str(emg_num)], NotificationCommands.disable_notifications),
-                        BlueGigaProtocol.ble_rsp_gatt_attribute_write
-                    )
-
-                    resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-                    if not resp_received:
-                        raise RuntimeError(f"GATT procedure (write completion to CCCD, emg {emg_num}) response timed out.")
+                for emg_num, packet in enumerate(self._pkt_emg_disable):
+                    self.write_packet_wait(packet, f"write completion to CCCD, emg {emg_num}")
 
             if self.imu_enabled or self.emg_enabled:
-                mode_command_payload = struct.pack('<5B',
-                                                   MyoCommands.myo_cmd_set_mode,
-                                                   3,  # Payload size
-                                                   EmgModes.myo_emg_mode_none,
-                                                   ImuModes.myo_imu_mode_none,
-                                                   ClassifierModes.myo_classifier_mode_disabled)
-
-                self.transmit_wait(
-                    self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['command_characteristic'], mode_command_payload),
-                    BlueGigaProtocol.ble_rsp_gatt_attribute_write
-                )
-
-                resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-                if not resp_received:
-                    raise RuntimeError("GATT procedure (write completion) response timed out.")
+                self.write_packet_wait(self._pkt_set_mode[(EmgModes.myo_emg_mode_none, ImuModes.myo_imu_mode_none)], "write completion")
 
             if self.sleep_disabled:
-                sleep_mode           = SleepModes.myo_sleep_mode_normal
-                mode_command_payload = struct.pack('<3B',
-                                                   MyoCommands.myo_cmd_set_sleep_mode,
-                                                   1,  # Payload size
-                                                   sleep_mode)
-
-                self.transmit_wait(
-                    self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['command_characteristic'], mode_command_payload),
-                    BlueGigaProtocol.ble_rsp_gatt_attribute_write
-                )
-
-                resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-                if not resp_received:
-                    raise RuntimeError("GATT procedure (write completion) response timed out.")
+                self.write_packet_wait(self._pkt_set_sleep_mode[SleepModes.myo_sleep_mode_normal], "write completion")
 
         self.emg_enabled    = False
         self.imu_enabled    = False
@@ -147,7 +127,16 @@ class MyoDongle:
 
         # Stop scanning
         self.transmit_wait(self.ble.ble_cmd_gap_end_procedure(), BlueGigaProtocol.ble_rsp_gap_end_procedure)
-        self.handlers = {}
+        self.handlers        = {}
+        self.emg_descriptors = ()
+        self._handlers_ready = False
+
+    def close(self):
+        """
+        Stops reading from the dongle and closes its serial port, call clear_state() first to leave the Myo device idle.
+        """
+
+        self.ble.close()
 
     def discover_myo_devices(self, timeout=2):
         """
@@ -186,8 +175,8 @@ class MyoDongle:
 
         # Attempt to connect
         self.transmit_wait(
-            self.ble.ble_cmd_gap_connect_direct(myo_device_found['address'],
-                                                myo_device_found['address_type'],
+            self.ble.ble_cmd_gap_connect_direct(myo_device_found.address,
+                                                myo_device_found.address_type,
                                                 self.default_conn_interval_min,
                                                 self.default_conn_interval_max,
                                                 self.default_timeout,
@@ -199,6 +188,10 @@ class MyoDongle:
         resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_connection_status, timeout)
         if not resp_received:
             return False
+
+        # after a link loss, the packets built for the previous connection carry a stale connection handle
+        if self._handlers_ready:
+            self.build_command_packets()
         return True
 
     def discover_primary_services(self, timeout: int = 10):
@@ -213,7 +206,7 @@ class MyoDongle:
 
         # Find primary service groups
         self.transmit_wait(
-            self.ble.ble_cmd_attclient_read_by_group_type(self.ble.connection['connection'],
+            self.ble.ble_cmd_attclient_read_by_group_type(self.ble.connection.connection,
                                                           self.MIN_HANDLE,
                                                           self.MAX_HANDLE,
                                                           self.PRIMARY_SERVICE),
@@ -228,9 +221,9 @@ class MyoDongle:
             # For each service group:
             # -> Find available attributes
             self.transmit_wait(
-                self.ble.ble_cmd_attclient_find_information(self.ble.connection['connection'],
-                                                            service['start'],
-                                                            service['end']),
+                self.ble.ble_cmd_attclient_find_information(self.ble.connection.connection,
+                                                            service.start,
+                                                            service.end),
                 BlueGigaProtocol.ble_rsp_gatt_find_information
             )
 
@@ -255,11 +248,29 @@ class MyoDongle:
         if not resp_received:
             raise RuntimeError("Response timed out for the transmitted command.")
 
+    def write_packet_wait(self, packet, procedure, timeout: int = 2):
+        """
+        Send an attribute write packet built beforehand (see build_command_packets()) and wait until the GATT write
+        procedure completes.
+        Note: only one GATT procedure can be in progress per connection, so writes cannot be pipelined.
+
+        :param packet: A bytes object containing an attribute write command
+        :param procedure: Description of the write, used in the timeout error message
+        :param timeout: Time to wait for the write response and for the procedure completion
+        """
+
+        self.transmit_wait(packet, BlueGigaProtocol.ble_rsp_gatt_attribute_write, timeout)
+
+        resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed, timeout)
+        if not resp_received:
+            raise RuntimeError(f"GATT procedure ({procedure}) response timed out.")
+
     def add_imu_handler(self, handler):
         """
         On receiving an IMU data packet
 
         :param handler: A function to be called with the following signature:
+                        handler(orient_w, orient_x, orient_y, orient_z, accel_1, accel_2, accel_3, gyro_1, gyro_2, gyro_3)
         """
         if not self.imu_enabled:
             raise RuntimeError("IMU readings are not enabled.")
@@ -273,47 +284,88 @@ class MyoDongle:
             raise RuntimeError("BLE connection is None.")
 
         # ensure handlers have been discovered
-        self.check_handlers()
+        if not self._handlers_ready:
+            self.check_handlers()
 
-        self.transmit_wait(
-            self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['imu_descriptor'], NotificationCommands.enable_notifications),
-            BlueGigaProtocol.ble_rsp_gatt_attribute_write
-        )
-
-        resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-        if not resp_received:
-            raise RuntimeError("GATT procedure (write completion to CCCD) response timed out.")
+        self.write_packet_wait(self._pkt_imu_enable, "write completion to CCCD")
 
         # need to go one step further, by issuing a command to set "Myo device mode"
         emg_mode = EmgModes.myo_emg_mode_send_emg if self.emg_enabled else EmgModes.myo_emg_mode_none
 
-        mode_command_payload    = struct.pack('<5B',
-                                              MyoCommands.myo_cmd_set_mode,
-                                              3,  # Payload size
-                                              emg_mode,
-                                              ImuModes.myo_imu_mode_send_data,
-                                              ClassifierModes.myo_classifier_mode_disabled)
-
-        self.transmit_wait(
-            self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['command_characteristic'], mode_command_payload),
-            BlueGigaProtocol.ble_rsp_gatt_attribute_write
-        )
-
-        resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-        if not resp_received:
-            raise RuntimeError("GATT procedure (write completion) response timed out.")
+        self.write_packet_wait(self._pkt_set_mode[(emg_mode, ImuModes.myo_imu_mode_send_data)], "write completion")
 
         self.imu_enabled = True
 
     def add_emg_handler(self, handler):
         """
-        :param handler: A function with an appropriate signature to be called on incoming EMG data packets
+        :param handler: A function with an appropriate signature to be called on incoming EMG data packets,
+                        called positionally as handler(emg_list, sample_num) where emg_list is a memoryview
+                        of the 8 samples, reused after BlueGigaProtocol.EMG_SLOT_COUNT packets
+                        (use list(emg_list) to keep a copy)
         """
 
         if not self.emg_enabled:
             raise RuntimeError("EMG readings are not enabled.")
         self.ble.emg_event += handler
 
+    def add_emg_batch_handler(self, handler, batch_size: int = 8):
+        """
+        Receive EMG data packets in batches instead of one event per sample.
+        Note: the per-sample EMG and joint EMG/IMU events are not fired anymore, until the last batch handler is removed.
+
+        :param handler: A function to be called positionally as handler(emg_batch), with an int8 array of shape
+                        (8, 2 * batch_size), one row per channel
+        :param batch_size: Number of EMG data packets (2 samples each) per batch
+        """
+
+        if not self.emg_enabled:
+            raise RuntimeError("EMG readings are not enabled.")
+        self.ble.emg_batch_buffer = bytearray(16 * batch_size)
+        self.ble.emg_batch_count  = 0
+        self.ble.emg_batch_size   = batch_size
+        self.ble.emg_batch_event += handler
+
+    def remove_emg_batch_handler(self, handler):
+        """
+        Stop calling a handler added with add_emg_batch_handler().
+        Once no batch handler is left, batching is disabled and the per-sample EMG events are fired again
+        (a partially filled batch is dropped).
+
+        :param handler: The handler to remove
+        """
+
+        self.ble.emg_batch_event -= handler
+        if not self.ble.emg_batch_event.funcs:
+            self.ble.emg_batch_size   = 0
+            self.ble.emg_batch_buffer = None
+            self.ble.emg_batch_count  = 0
+
+    def add_emg_shared_ring(self, name=None, capacity: int = 4096):
+        """
+        Publish incoming EMG samples and their timestamps to a ring in shared memory, for consumers in other processes.
+        The ring gets every EMG data packet, whether EMG batching is on or not (see add_emg_batch_handler()).
+        Consumers attach with EmgSharedRing(ring.name, create=False) and poll EmgSharedRing.read().
+
+        :param name: Name of the shared memory block (None: a unique name is generated)
+        :param capacity: Number of samples kept in the ring
+        :return: [EmgSharedRing] The ring, to be removed with remove_emg_shared_ring() before being closed and unlinked
+        """
+
+        if not self.emg_enabled:
+            raise RuntimeError("EMG readings are not enabled.")
+        ring = EmgSharedRing(name, capacity)
+        self.ble.emg_rings.append(ring)
+        return ring
+
+    def remove_emg_shared_ring(self, ring):
+        """
+        Stop publishing EMG samples to a ring added with add_emg_shared_ring(), the ring can then be closed.
+
+        :param ring: The ring returned by add_emg_shared_ring()
+        """
+
+        self.ble.emg_rings.remove(ring)
+
     def enable_emg_readings(self):
         """
         Enable incoming EMG data packets from Myo device.
@@ -322,43 +374,26 @@ class MyoDongle:
             raise RuntimeError("BLE connection is None.")
 
         # ensure handlers have been discovered
-        self.check_handlers()
-
-        for emg_num in range(4):
-            self.transmit_wait(
-                self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['emg_descriptor_' + str(emg_num)], NotificationCommands.enable_notifications),
-                BlueGigaProtocol.ble_rsp_gatt_attribute_write
-            )
+        if not self._handlers_ready:
+            self.check_handlers()
 
-            resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-            if not resp_received:
-                raise RuntimeError(f"GATT procedure (write completion to CCCD, emg {emg_num}) response timed out.")
+        for emg_num, packet in enumerate(self._pkt_emg_enable):
+            self.write_packet_wait(packet, f"write completion to CCCD, emg {emg_num}")
 
         # need to go one step further, by issuing a command to set "Myo device mode"
         imu_mode = ImuModes.myo_imu_mode_send_data if self.imu_enabled else ImuModes.myo_imu_mode_none
 
-        mode_command_payload = struct.pack('<5B',
-                                           MyoCommands.myo_cmd_set_mode,
-                                           3,  # Payload size
-                                           EmgModes.myo_emg_mode_send_emg,
-                                           imu_mode,
-                                           ClassifierModes.myo_classifier_mode_disabled)
-
-        self.transmit_wait(
-            self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['command_characteristic'], mode_command_payload),
-            BlueGigaProtocol.ble_rsp_gatt_attribute_write
-        )
-
-        resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-        if not resp_received:
-            raise RuntimeError("GATT procedure (write completion) response timed out.")
+        self.write_packet_wait(self._pkt_set_mode[(EmgModes.myo_emg_mode_send_emg, imu_mode)], "write completion")
 
         self.emg_enabled = True
 
     def add_joint_emg_imu_handler(self, handler):
         """
 
-        :param handler: A function with an appropriate signature to be called on incoming EMG & IMU data packets
+        :param handler: A function with an appropriate signature to be called on incoming EMG & IMU data packets,
+                        called positionally as handler(emg_list, orient_w, orient_x, orient_y, orient_z,
+                        accel_1, accel_2, accel_3, gyro_1, gyro_2, gyro_3, sample_num)
+                        (wrap slow handlers in utils.QueuedHandler, to run them off the packet parsing path)
         """
 
         if not self.imu_enabled:
@@ -378,11 +413,12 @@ class MyoDongle:
             raise RuntimeError("BLE connection is None.")
 
         # ensure handlers have been discovered
-        self.check_handlers()
+        if not self._handlers_ready:
+            self.check_handlers()
 
         # issue a command to read Myo device battery level
         self.transmit_wait(
-            self.ble.ble_cmd_attclient_read_by_handle(self.ble.connection['connection'], self.ble.battery_handler),
+            self.ble.ble_cmd_attclient_read_by_handle(self.ble.connection.connection, self.ble.battery_handler),
             BlueGigaProtocol.ble_evt_gatt_attribute_value
         )
 
@@ -397,24 +433,13 @@ class MyoDongle:
             raise RuntimeError("BLE connection is None.")
 
         # ensure handlers have been discovered
-        self.check_handlers()
+        if not self._handlers_ready:
+            self.check_handlers()
 
         # issue a command to set "Myo device sleep mode"
         sleep_mode = SleepModes.myo_sleep_mode_normal if device_can_sleep else SleepModes.myo_sleep_mode_never_sleep
 
-        mode_command_payload = struct.pack('<3B',
-                                           MyoCommands.myo_cmd_set_sleep_mode,
-                                           1,  # Payload size
-                                           sleep_mode)
-
-        self.transmit_wait(
-            self.ble.ble_cmd_attclient_attribute_write(self.ble.connection['connection'], self.handlers['command_characteristic'], mode_command_payload),
-            BlueGigaProtocol.ble_rsp_gatt_attribute_write
-        )
-
-        resp_received = self.ble.read_packets_conditional(BlueGigaProtocol.ble_evt_gatt_procedure_completed)
-        if not resp_received:
-            raise RuntimeError("GATT procedure (write completion) response timed out.")
+        self.write_packet_wait(self._pkt_set_sleep_mode[sleep_mode], "write completion")
 
         self.sleep_disabled = not device_can_sleep
 
@@ -442,7 +467,7 @@ class MyoDongle:
         """
 
         # need to be able to activate notifications via writing to descriptor handlers
-        if len(self.handlers.keys()) == 0:
+        if not self._handlers_ready:
             self.discover_primary_services()
             if len(self.ble.found_attributes) == 0:
                 raise RuntimeError("No attributes found, ensure discover_primary_services() was called.")
@@ -452,49 +477,86 @@ class MyoDongle:
         """
         This function fills self.ble and self.handlers with key Myo handlers.
         """
-        imu_uuid     = get_full_uuid(HardwareServices.IMUDataCharacteristic)
-        command_uuid = get_full_uuid(HardwareServices.CommandCharacteristic)
-        emg_uuid_0   = get_full_uuid(HardwareServices.EmgData0Characteristic)
-        emg_uuid_1   = get_full_uuid(HardwareServices.EmgData1Characteristic)
-        emg_uuid_2   = get_full_uuid(HardwareServices.EmgData2Characteristic)
-        emg_uuid_3   = get_full_uuid(HardwareServices.EmgData3Characteristic)
-        battery_uuid  = HardwareServices.BatteryLevelCharacteristic
+        emg_descriptors = [None, None, None, None]
 
         for attribute in self.ble.found_attributes:
-            if attribute['uuid'].endswith(imu_uuid):
+            role = _ATTRIBUTE_ROLES.get(attribute.uuid)
+            if role is None:
+                continue
+
+            if role == 'imu':
                 # Assumption:
                 #       > Client Characteristic Configuration Descriptor comes right after characteristic attribute.
-                self.ble.imu_handler             = attribute['chr_handler']
-                self.handlers['imu_descriptor']  = attribute['chr_handler'] + 1
-
-            elif attribute['uuid'].endswith(command_uuid):
-                self.handlers['command_characteristic'] = attribute['chr_handler']
-
-            elif attribute['uuid'].endswith(emg_uuid_0):
-                self.ble.emg_handler_0               = attribute['chr_handler']
-                self.handlers['emg_descriptor_0']    = attribute['chr_handler'] + 1
-            elif attribute['uuid'].endswith(emg_uuid_1):
-                self.ble.emg_handler_1               = attribute['chr_handler']
-                self.handlers['emg_descriptor_1']    = attribute['chr_handler'] + 1
-            elif attribute['uuid'].endswith(emg_uuid_2):
-                self.ble.emg_handler_2               = attribute['chr_handler']
-                self.handlers['emg_descriptor_2']    = attribute['chr_handler'] + 1
-            elif attribute['uuid'].endswith(emg_uuid_3):
-                self.ble.emg_handler_3               = attribute['chr_handler']
-                self.handlers['emg_descriptor_3']    = attribute['chr_handler'] + 1
-
-            elif attribute['uuid'].endswith(battery_uuid):
-                self.ble.battery_handler = attribute['chr_handler']
+                self.ble.imu_handler             = attribute.chr_handler
+                self.handlers['imu_descriptor']  = attribute.chr_handler + 1
+
+            elif role == 'command':
+                self.handlers['command_characteristic'] = attribute.chr_handler
+
+            elif role == 'emg_0':
+                self.ble.emg_handler_0               = attribute.chr_handler
+                emg_descriptors[0]                   = attribute.chr_handler + 1
+            elif role == 'emg_1':
+                self.ble.emg_handler_1               = attribute.chr_handler
+                emg_descriptors[1]                   = attribute.chr_handler + 1
+            elif role == 'emg_2':
+                self.ble.emg_handler_2               = attribute.chr_handler
+                emg_descriptors[2]                   = attribute.chr_handler + 1
+            elif role == 'emg_3':
+                self.ble.emg_handler_3               = attribute.chr_handler
+                emg_descriptors[3]                   = attribute.chr_handler + 1
+
+            elif role == 'battery':
+                self.ble.battery_handler = attribute.chr_handler
 
         if 'imu_descriptor' not in self.handlers:
             raise RuntimeError("Unable to find IMU attribute, in device's GATT database.")
         if 'command_characteristic' not in self.handlers:
             raise RuntimeError("Unable to find command attribute, in device's GATT database.")
-        if 'emg_descriptor_0' not in self.handlers:
+        if emg_descriptors[0] is None:
             raise RuntimeError("Unable to find EMG attribute 0, in device's GATT database.")
-        if 'emg_descriptor_1' not in self.handlers:
+        if emg_descriptors[1] is None:
             raise RuntimeError("Unable to find EMG attribute 1, in device's GATT database.")
-        if 'emg_descriptor_2' not in self.handlers:
+        if emg_descriptors[2] is None:
             raise RuntimeError("Unable to find EMG attribute 2, in device's GATT database.")
-        if 'emg_descriptor_3' not in self.handlers:
+        if emg_descriptors[3] is None:
             raise RuntimeError("Unable to find EMG attribute 3, in device's GATT database.")
+        self.emg_descriptors = tuple(emg_descriptors)
+
+        # handles are known from here on, attribute values can be dispatched and commands pre-built
+        self.ble.build_attribute_dispatch()
+        self.build_command_packets()
+        self._handlers_ready = True
+
+    def build_command_packets(self):
+        """
+        Builds the attribute write packets that switch notifications and Myo device modes, once the handlers are known.
+        Their contents only depend on the connection and the handlers, so they are reused on every state change.
+        """
+        connection = self.ble.connection.connection
+        write      = self.ble.ble_cmd_attclient_attribute_write
+        command    = self.handlers['command_characteristic']
+
+        self._pkt_imu_enable  = write(connection, self.handlers['imu_descriptor'], NotificationCommands.enable_notifications)
+        self._pkt_imu_disable = write(connection, self.handlers['imu_descriptor'], NotificationCommands.disable_notifications)
+        self._pkt_emg_enable  = tuple(write(connection, handle, NotificationCommands.enable_notifications) for handle in self.emg_descriptors)
+        self._pkt_emg_disable = tuple(write(connection, handle, NotificationCommands.disable_notifications) for handle in self.emg_descriptors)
+
+        # set mode command, for each (EMG mode, IMU mode) in use
+        self._pkt_set_mode = {}
+        for emg_mode in (EmgModes.myo_emg_mode_none, EmgModes.myo_emg_mode_send_emg):
+            for imu_mode in (ImuModes.myo_imu_mode_none, ImuModes.myo_imu_mode_send_data):
+                mode_command_payload = _MODE_CMD.pack(MyoCommands.myo_cmd_set_mode,
+                                                      3,  # Payload size
+                                                      emg_mode,
+                                                      imu_mode,
+                                                      ClassifierModes.myo_classifier_mode_disabled)
+                self._pkt_set_mode[(emg_mode, imu_mode)] = write(connection, command, mode_command_payload)
+
+        # set sleep mode command, for each sleep mode
+        self._pkt_set_sleep_mode = {}
+        for sleep_mode in (SleepModes.myo_sleep_mode_normal, SleepModes.myo_sleep_mode_never_sleep):
+            mode_command_payload = _SLEEP_CMD.pack(MyoCommands.myo_cmd_set_sleep_mode,
+                                                   1,  # Payload size
+                                                   sleep_mode)
+            self._pkt_set_sleep_mode[sleep_mode] = write(connection, command, mode_command_payload)
@@ -1,7 +1,11 @@
+import logging
 from core import MyoDongle, joint_event_handler
 
 
 if __name__ == '__main__':
+    # joint_event_handler() reports the samples as debug messages
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+
     device = MyoDongle('/dev/ttyACM0')
     device.clear_state()
 
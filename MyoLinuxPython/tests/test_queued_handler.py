@@ -0,0 +1,83 @@
+import threading
+import unittest
+from utils.event import QueuedHandler
+
+
+class TestQueuedHandler(unittest.TestCase):
+
+    def test_calls_run_in_order_on_worker(self):
+        calls   = []
+        threads = set()
+
+        def handler(*args, **kwargs):
+            calls.append((args, kwargs))
+            threads.add(threading.current_thread())
+
+        queued = QueuedHandler(handler)
+        for i in range(100):
+            queued(i, sample_num=i % 2)
+        queued.stop()
+
+        self.assertEqual(calls, [((i,), {'sample_num': i % 2}) for i in range(100)])
+        self.assertEqual(threads, {queued.worker})
+
+    def test_memoryview_arguments_are_copied(self):
+        calls  = []
+        buffer = bytearray(range(8))
+
+        queued = QueuedHandler(lambda emg_list, sample_num: calls.append(emg_list))
+        queued(memoryview(buffer), 1)
+        buffer[0] = 99
+        queued.stop()
+
+        self.assertEqual(calls, [list(range(8))])
+
+    def test_exception_does_not_end_worker(self):
+        calls = []
+
+        def handler(i):
+            if i == 1:
+                raise ValueError(i)
+            calls.append(i)
+
+        queued = QueuedHandler(handler)
+        with self.assertLogs('utils.event', level='ERROR'):
+            for i in range(4):
+                queued(i)
+            queued.stop()
+
+        self.assertEqual(calls, [0, 2, 3])
+
+    def test_oldest_calls_dropped_when_full(self):
+        calls   = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def handler(i):
+            started.set()
+            release.wait()
+            calls.append(i)
+
+        queued = QueuedHandler(handler, maxsize=2)
+        queued(0)
+        started.wait()
+        # the worker is busy with call 0, calls 1 and 2 are dropped to make room for 3 and 4
+        for i in range(1, 5):
+            queued(i)
+        release.set()
+        queued.stop()
+
+        self.assertEqual(queued.dropped, 2)
+        self.assertEqual(calls, [0, 3, 4])
+
+    def test_calls_rejected_after_stop(self):
+        queued = QueuedHandler(lambda *args: None)
+        queued.stop()
+
+        self.assertFalse(queued.worker.is_alive())
+        with self.assertRaises(RuntimeError):
+            queued(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import subprocess
+import unittest
+from utils.shared_ring import EmgSharedRing
+
+# MyoLinuxPython directory, so that the consumer process imports the same `utils` package
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# consumer process: attach to the ring, print the samples read, detach and exit
+CONSUMER = """
+import sys
+from utils.shared_ring import EmgSharedRing
+ring = EmgSharedRing(sys.argv[1], create=False)
+samples, timestamps, count = ring.read(0)
+print(count, samples.tolist(), len(timestamps))
+ring.close()
+"""
+
+
+class TestEmgSharedRing(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = EmgSharedRing(capacity=4)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def run_consumer(self):
+        result = subprocess.run([sys.executable, '-c', CONSUMER, self.ring.name],
+                                cwd=ROOT_DIR, capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout.strip()
+
+    def test_consumer_exit_keeps_ring(self):
+        self.ring.write_sample(list(range(8)))
+        expected = f'1 {[list(range(8))]} 1'
+
+        # a consumer exiting must not unlink the producer's block: a second consumer can still attach to it
+        self.assertEqual(self.run_consumer(), expected)
+        self.assertEqual(self.run_consumer(), expected)
+
+    def test_read_wraps_around(self):
+        for i in range(6):
+            self.ring.write_sample([i] * 8)
+
+        samples, timestamps, count = self.ring.read(0)
+        self.assertEqual(count, 6)
+        self.assertEqual(samples[:, 0].tolist(), [2, 3, 4, 5])
+        self.assertTrue((timestamps[1:] >= timestamps[:-1]).all())
+
+    def test_write_packet(self):
+        before = time.monotonic_ns()
+        self.ring.write_packet(bytes(range(16)))
+
+        samples, timestamps, count = self.ring.read(0)
+        self.assertEqual(count, 2)
+        self.assertEqual(samples.tolist(), [list(range(8)), list(range(8, 16))])
+        self.assertTrue((timestamps >= before).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,2 +1,3 @@
 from .event import *
 from .packet_def import *
+from .shared_ring import *
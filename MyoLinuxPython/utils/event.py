@@ -18,6 +18,9 @@ limitations under the License.
 # https://emptypage.jp/notes/pyevent.en.html
 # https://github.com/sebastiankmiec/PythonMyoLinux/pymyolinux
 
+import logging
+import threading
+from collections import deque
 from typing import Optional, TypeVar, Callable, Any, Type
 
 __all__ = [
@@ -25,9 +28,12 @@ __all__ = [
     'EventHandler',
     'EventType',
     'EventHandlerType',
+    'QueuedHandler',
 ]
 
 
+logger = logging.getLogger(__name__)
+
 EventType = TypeVar('EventType', bound='Event')
 EventHandlerType = TypeVar('EventHandlerType', bound='EventHandler')
 
@@ -35,30 +41,41 @@ EventHandlerType = TypeVar('EventHandlerType', bound='EventHandler')
 class Event:
     is_pass_sender = False
 
-    def __init__(self, doc: Optional[str] = None, is_fire: bool = False):
+    def __init__(self, doc: Optional[str] = None, is_fire: bool = False, is_counted: bool = True):
         """
 
         :param doc: documentation.
         :param is_fire: whether to pass sender object or not. Default: False.
+        :param is_counted: whether to count the fires in the sender's `__eventcounter__`. Default: True.
         """
 
-        self.__doc__ = doc
-        self.is_fire = is_fire
+        self.__doc__    = doc
+        self.is_fire    = is_fire
+        self.is_counted = is_counted
+        self.name       = None
+
+    def __set_name__(self, owner: Type[object], name: str):
+        self.name = name
 
     def __get__(self, obj: Optional[EventType], objtype: Optional[Type[object]] = None):
         if obj is None:
             return self
-        return EventHandler(self, obj)
-
-    def __set__(self, obj: EventType, value: float):
-        pass
+        # one EventHandler per object and event, created on first access and stored as an instance attribute,
+        # which hides this (non-data) descriptor: later accesses are plain attribute lookups
+        handler = EventHandler(self, obj)
+        obj.__dict__[self.name] = handler
+        return handler
 
 
 class EventHandler:
+    __slots__ = ('evt', 'obj', 'funcs', 'pass_sender', 'is_counted')
 
     def __init__(self, evt: EventType, obj: EventType):
-        self.evt = evt
-        self.obj = obj
+        self.evt         = evt
+        self.obj         = obj
+        self.funcs       = self._get_func_list()
+        self.pass_sender = evt.is_fire == evt.is_pass_sender
+        self.is_counted  = evt.is_counted
 
     def _get_func_list(self):
         try:
@@ -77,7 +94,7 @@ class EventHandler:
         :return:
         """
 
-        self._get_func_list().append(func)
+        self.funcs.append(func)
         # return a reference to the instance object on which it is called
         return self
 
@@ -89,35 +106,100 @@ class EventHandler:
         :param func: the event handler function.
         :return:
         """
-        self._get_func_list().remove(func)
+        self.funcs.remove(func)
         return self
 
-    def fire(self, **kwargs):
+    def fire(self, *args, **kwargs):
         """
         Fire the event and call all event handler functions.
         You can call EventHandler object itself like a(arg) instead of a.fire(arg).
 
+        :param args: the positional arguments.
         :param kwargs: the argument dictionary.
         :return:
         """
 
         # keep track of event count
-        try:
-            event_counter = self.obj.__eventcounter__
-        except AttributeError:
-            event_counter = self.obj.__eventcounter__ = {}
+        if self.is_counted:
+            try:
+                event_counter = self.obj.__eventcounter__
+            except AttributeError:
+                event_counter = self.obj.__eventcounter__ = {}
+
+            if self.evt in event_counter:
+                event_counter[self.evt] += 1
+            else:
+                event_counter[self.evt] = 1
 
-        if self.evt in event_counter:
-            event_counter[self.evt] += 1
+        if self.pass_sender:
+            for func in self.funcs:
+                func(self.obj, *args, **kwargs)
         else:
-            event_counter[self.evt] = 1
-
-        for func in self._get_func_list():
-            if self.evt.is_fire == self.evt.is_pass_sender:
-                func(self.obj, **kwargs)
-            else:
-                func(**kwargs)
+            for func in self.funcs:
+                func(*args, **kwargs)
 
     __iadd__ = add
     __isub__ = remove
     __call__ = fire
+
+
+class QueuedHandler:
+    """
+    Wraps an event handler so that it runs on its own worker thread, firing the event only queues the call.
+    Slow handlers then do not hold up packet parsing; when a handler falls more than maxsize calls behind,
+    the oldest queued calls are dropped (counted in `dropped`).
+    An exception raised by the handler is logged, the following calls are still handled.
+    """
+
+    def __init__(self, func: Callable[..., Any], maxsize: int = 1024):
+        """
+
+        :param func: the event handler function.
+        :param maxsize: the maximum number of queued calls.
+        """
+
+        self.func    = func
+        self.calls   = deque(maxlen=maxsize)
+        self.ready   = threading.Condition()
+        self.running = True
+        self.dropped = 0
+        self.worker  = threading.Thread(target=self._run, name='QueuedHandler', daemon=True)
+        self.worker.start()
+
+    def __call__(self, *args, **kwargs):
+        # memoryviews (e.g. EMG samples) are reused by the sender, queue a copy
+        args = tuple(arg.tolist() if isinstance(arg, memoryview) else arg for arg in args)
+        with self.ready:
+            if not self.running:
+                raise RuntimeError("QueuedHandler is stopped, it does not accept calls anymore.")
+            if len(self.calls) == self.calls.maxlen:
+                self.dropped += 1
+            self.calls.append((args, kwargs))
+            self.ready.notify()
+
+    def _run(self):
+        while True:
+            with self.ready:
+                while self.running and (len(self.calls) == 0):
+                    self.ready.wait()
+                if len(self.calls) == 0:
+                    # stopped, and every queued call was handled
+                    return
+                args, kwargs = self.calls.popleft()
+            try:
+                self.func(*args, **kwargs)
+            except Exception:
+                # one failing call must not end the worker, the later calls would never run
+                logger.exception("QueuedHandler: the event handler raised an exception.")
+
+    def stop(self):
+        """
+        Handles the remaining queued calls, then ends the worker thread; later calls raise RuntimeError.
+
+        :return:
+        """
+
+        with self.ready:
+            self.running = False
+            self.ready.notify()
+        self.worker.join()
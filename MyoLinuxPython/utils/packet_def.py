@@ -18,7 +18,7 @@ limitations under the License.
 # https://github.com/thalmiclabs/myo-bluetooth
 # https://github.com/sebastiankmiec/PythonMyoLinux/pymyolinux
 
-import copy
+from functools import lru_cache
 
 __all__ = [
     'get_full_uuid',
@@ -50,17 +50,27 @@ __all__ = [
     'SleepModes'
 ]
 
-MYO_SERVICE_BASE_UUID = bytearray(b'\x42\x48\x12\x4a\x7f\x2c\x48\x47\xb9\xde\x04\xa9\x00\x00\x06\xd5')
 
+class _Namespace:
+    """
+    Base of the constant classes below: they only group constants, and cannot be instantiated.
+    """
+    __slots__ = ()
 
+    def __new__(cls, *args, **kwargs):
+        raise TypeError(f"{cls.__name__} only groups constants, it cannot be instantiated.")
+
+
+MYO_SERVICE_BASE_UUID = b'\x42\x48\x12\x4a\x7f\x2c\x48\x47\xb9\xde\x04\xa9\x00\x00\x06\xd5'
+
+
+@lru_cache(maxsize=None)
 def get_full_uuid(short_uuid):
-    new_uuid = copy.deepcopy(MYO_SERVICE_BASE_UUID)
-    new_uuid[12] = short_uuid[1]
-    new_uuid[13] = short_uuid[0]
-    return new_uuid
+    # the short UUID replaces bytes 12 and 13 of the base UUID, in reverse order
+    return MYO_SERVICE_BASE_UUID[:12] + short_uuid[::-1] + MYO_SERVICE_BASE_UUID[14:]
 
 
-class HardwareServices:
+class HardwareServices(_Namespace):
     ControlService              = b'\x00\x01'   # Myo info service (advertising packets)
 
     CommandCharacteristic       = b'\x04\x01'   # only-writen attribute to issue commands (such as setting Myo mode)
@@ -78,60 +88,60 @@ class HardwareServices:
 # Bluegiga packet definitions
 
 # message types
-class BluetoothMessages:
+class BluetoothMessages(_Namespace):
     bluetooth_resp  = 0x00
     bluetooth_event = 0x80
 
 
-class WifiMessages:
+class WifiMessages(_Namespace):
     wifi_resp  = 0x08
     wifi_event = 0x88
 
 
-class CommandMessages:
+class CommandMessages(_Namespace):
     command_message = 0x00
 
 
-class PackageMessages:
+class PackageMessages(_Namespace):
     packet_header_length    = 4
     packet_type_bits        = 0x88
     packet_length_high_bits = 0x07
 
 
-class BGAPIClasses:
+class BGAPIClasses(_Namespace):
     Connection = 0x03   # functions to access connection management
     GATT       = 0x04   # functions to access remote devices GATT database
     GAP        = 0x06   # GAP (Generic Access Profile) functions
 
 
-class ConnectionResponseCommands:
+class ConnectionResponseCommands(_Namespace):
     ble_rsp_connection_disconnect = 0x00    # response
 
 
-class ConnectionEventCommands:
+class ConnectionEventCommands(_Namespace):
     ble_evt_connection_status       = 0x00  # event
     ble_evt_connection_disconnected = 0x04  # event
 
 
-class GATTResponseCommands:
+class GATTResponseCommands(_Namespace):
     ble_rsp_gatt_read_by_group_type = 0x01
     ble_rsp_gatt_find_information   = 0x03
     ble_rsp_gatt_attribute_write    = 0x05
 
 
-class GATTEventCommands:
+class GATTEventCommands(_Namespace):
     ble_evt_gatt_procedure_completed    = 0x01
     ble_evt_gatt_group_found            = 0x02
     ble_evt_gatt_find_information_found = 0x04
     ble_evt_gatt_attribute_value        = 0x05
 
 
-class GAPEventCommands:
+class GAPEventCommands(_Namespace):
     ble_evt_gap_scan_response = 0x00
     ble_evt_gap_mode_changed  = 0x01
 
 
-class GAPResponseCommands:
+class GAPResponseCommands(_Namespace):
     ble_rsp_gap_set_mode        = 0x01
     ble_rsp_gap_discover        = 0x02
     ble_rsp_gap_connect_direct  = 0x03
@@ -141,7 +151,7 @@ class GAPResponseCommands:
 # Bluegiga packet definitions for transmission
 
 # GATT
-class GATTTransmitCommands:
+class GATTTransmitCommands(_Namespace):
     ble_tmt_connection_disconnect        = 0x00
     ble_tmt_attclient_read_by_group_type = 0x01
     ble_tmt_attclient_find_information   = 0x03
@@ -150,7 +160,7 @@ class GATTTransmitCommands:
 
 
 # GAP
-class GAPTransmitCommands:
+class GAPTransmitCommands(_Namespace):
     ble_tmt_gap_set_mode       = 0x01
     ble_tmt_gap_discover       = 0x02
     ble_tmt_gap_connect_direct = 0x03
@@ -159,12 +169,12 @@ class GAPTransmitCommands:
 
 # BLE command definitions
 
-class NotificationCommands:
+class NotificationCommands(_Namespace):
     disable_notifications = b'\x00\x00'
     enable_notifications  = b'\x01\x00'
 
 
-class ConnectionStatus:
+class ConnectionStatus(_Namespace):
     connection_connected         = 1
     connection_encrypted         = 2
     connection_completed         = 4
@@ -172,7 +182,7 @@ class ConnectionStatus:
     connection_connstatus_max    = 9
 
 
-class GAPDiscoverableModes:
+class GAPDiscoverableModes(_Namespace):
     gap_non_discoverable      = 0
     gap_limited_discoverable  = 1
     gap_general_discoverable  = 2
@@ -181,7 +191,7 @@ class GAPDiscoverableModes:
     gap_discoverable_mode_max = 5
 
 
-class GAPConnectableModes:
+class GAPConnectableModes(_Namespace):
     gap_non_connectable        = 0
     gap_directed_connectable   = 1
     gap_undirected_connectable = 2
@@ -189,7 +199,7 @@ class GAPConnectableModes:
     gap_connectable_mode_max   = 4
 
 
-class GAPDiscoverModes:
+class GAPDiscoverModes(_Namespace):
     gap_discover_limited     = 0
     gap_discover_generic     = 1
     gap_discover_observation = 2
@@ -197,7 +207,7 @@ class GAPDiscoverModes:
 
 
 # BLE Response Conditions
-class BleResponseConditions:
+class BleResponseConditions(_Namespace):
     find_info_success            = 0
     write_success                = 0
     disconnect_procedure_started = 0
@@ -209,13 +219,13 @@ class BleResponseConditions:
 
 
 # Bluetooth error codes
-class BleErrorCodes:
+class BleErrorCodes(_Namespace):
     connection_timeout            = 0x0208
     connection_term_by_local_host = 0x0216
 
 
 # Myo command definitions
-class MyoCommands:
+class MyoCommands(_Namespace):
     myo_cmd_set_mode       = 0x01   # set EMG and IMU modes
     myo_cmd_vibrate        = 0x03   # vibrate
     myo_cmd_deep_sleep     = 0x04   # put Myo into deep sleep
@@ -225,13 +235,13 @@ class MyoCommands:
     myo_cmd_user_action    = 0x0b   # notify user that an action has been recognized / confirmed
 
 
-class EmgModes:
+class EmgModes(_Namespace):
     myo_emg_mode_none         = 0x00    # do not send EMG data
     myo_emg_mode_send_emg     = 0x02    # send filtered EMG data
     myo_emg_mode_send_emg_raw = 0x03    # send raw(unfiltered) EMG data
 
 
-class ImuModes:
+class ImuModes(_Namespace):
     myo_imu_mode_none        = 0x00     # do not send IMU data or events
     myo_imu_mode_send_data   = 0x01     # send IMU data streams (accelerometer, gyroscope, and orientation)
     myo_imu_mode_send_events = 0x02     # send motion events detected by the IMU (e.g. taps)
@@ -239,11 +249,11 @@ class ImuModes:
     myo_imu_mode_send_raw    = 0x04     # send raw IMU data streams
 
 
-class ClassifierModes:
+class ClassifierModes(_Namespace):
     myo_classifier_mode_disabled = 0x00     # disable and reset the internal state of the onboard classifier
     myo_classifier_mode_enabled  = 0x01     # send classifier events (poses and arm events)
 
 
-class SleepModes:
+class SleepModes(_Namespace):
     myo_sleep_mode_normal      = 0  # normal sleep mode; Myo will sleep after a period of inactivity
     myo_sleep_mode_never_sleep = 1  # never go to sleep
@@ -0,0 +1,153 @@
+"""
+Copyright 2022 Phuc Thanh-Thien Nguyen
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+# Single producer, multiple consumer ring of EMG samples in shared memory,
+# so that other processes can read the EMG stream without going through the event handlers
+
+import sys
+import time
+from typing import Optional, Tuple
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+
+__all__ = [
+    'EmgSharedRing',
+]
+
+
+class EmgSharedRing:
+    """
+    Ring of int8 EMG samples (8 channels) in a shared memory block, each with its time.monotonic_ns() timestamp
+    (CLOCK_MONOTONIC, comparable across processes).
+
+    Layout: int64 write count, int64 capacity, capacity int64 timestamps, then capacity rows of 8 int8 samples.
+    The producer writes a row before bumping the write count, so consumers only need the count to find new rows.
+    No locks are taken: a consumer that falls more than capacity samples behind loses the oldest ones.
+    """
+    NUM_CHANNELS = 8
+    HEADER_SIZE  = 16
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 4096, create: bool = True):
+        """
+
+        :param name: Name of the shared memory block (None: a unique name is generated when creating).
+        :param capacity: Number of samples kept in the ring, only used when creating.
+        :param create: True: create the block (producer) / False: attach to an existing block (consumer).
+        """
+
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=self.HEADER_SIZE + capacity * (8 + self.NUM_CHANNELS))
+        elif sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # the consumer does not own the block, its resource tracker would unlink it when the consumer exits
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[0] = 0
+            self.header[1] = capacity
+        self.capacity   = int(self.header[1])
+        self.timestamps = np.ndarray((self.capacity,), dtype=np.int64, buffer=self.shm.buf, offset=self.HEADER_SIZE)
+        self.samples    = np.ndarray((self.capacity, self.NUM_CHANNELS), dtype=np.int8,
+                                     buffer=self.shm.buf, offset=self.HEADER_SIZE + 8 * self.capacity)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_count(self):
+        """
+        Number of samples written since the ring was created.
+        """
+
+        return int(self.header[0])
+
+    def write_sample(self, emg_list, sample_num: int = 0):
+        """
+        Appends one sample to the ring, can be registered as an EMG handler (see MyoDongle.add_emg_handler()).
+
+        :param emg_list: The 8 EMG samples.
+        :param sample_num: Unused, keeps the EMG handler signature.
+        :return: None
+        """
+
+        count = self.header[0]
+        row   = count % self.capacity
+        self.samples[row]    = emg_list
+        self.timestamps[row] = time.monotonic_ns()
+        self.header[0] = count + 1
+
+    def write_packet(self, packet):
+        """
+        Appends the two samples of an EMG data packet.
+
+        :param packet: The 16 bytes of an EMG attribute value.
+        :return: None
+        """
+
+        samples = np.frombuffer(packet, dtype=np.int8)
+        self.write_sample(samples[:8])
+        self.write_sample(samples[8:])
+
+    def read(self, index: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Copies the samples written since index (a previous return value, 0 at first).
+
+        :param index: Write count up to which samples were already read.
+        :return: (samples of shape (N, 8), their N timestamps in ns, write count to pass to the next call)
+        """
+
+        count = int(self.header[0])
+        start = max(index, count - self.capacity)
+        if start >= count:
+            return np.empty((0, self.NUM_CHANNELS), dtype=np.int8), np.empty((0,), dtype=np.int64), count
+
+        first = start % self.capacity
+        last  = count % self.capacity
+        if first < last:
+            samples    = self.samples[first:last].copy()
+            timestamps = self.timestamps[first:last].copy()
+        else:
+            samples    = np.concatenate((self.samples[first:], self.samples[:last]))
+            timestamps = np.concatenate((self.timestamps[first:], self.timestamps[:last]))
+
+        # rows overwritten by the producer while copying are dropped
+        overwritten = int(self.header[0]) - self.capacity - start
+        if overwritten > 0:
+            samples    = samples[overwritten:]
+            timestamps = timestamps[overwritten:]
+        return samples, timestamps, count
+
+    def close(self):
+        """
+        Detaches from the shared memory block (every process calls this).
+        The producer first stops writing, see MyoDongle.remove_emg_shared_ring().
+        """
+
+        self.header     = None
+        self.timestamps = None
+        self.samples    = None
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory block (the producer calls this once, after close()).
+        """
+
+        self.shm.unlink()